@@ -0,0 +1,34 @@
+import time
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from .models import DoctorProfile
+
+# Process-local cache of {doctor_id: (max_appointments, expires_at)}. Profile saves in this
+# process invalidate an entry immediately; the TTL bounds staleness across processes.
+_max_appointments_cache = {}
+
+
+def max_appointments(doctor_id):
+    """Return the doctor's daily appointment cap without a database hit on a warm cache."""
+    cached = _max_appointments_cache.get(doctor_id)
+    now = time.monotonic()
+    if cached and cached[1] > now:
+        return cached[0]
+    value = DoctorProfile.objects.filter(user_id=doctor_id).values_list('max_appointments', flat=True).first()
+    if value is None:
+        value = DoctorProfile._meta.get_field('max_appointments').default
+    _max_appointments_cache[doctor_id] = (value, now + settings.DOCTOR_CAPACITY_CACHE_TTL)
+    return value
+
+
+def invalidate(doctor_id):
+    _max_appointments_cache.pop(doctor_id, None)
+
+
+def adjust_current_appointments(doctor_id, delta):
+    # Single UPDATE with an F() expression; concurrent bookings never lose increments.
+    if delta:
+        DoctorProfile.objects.filter(user_id=doctor_id).update(
+            current_appointments=Greatest(F('current_appointments') + delta, 0)
+        )
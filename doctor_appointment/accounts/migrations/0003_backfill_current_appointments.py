@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+ACTIVE_STATUSES = ('PENDING', 'CONFIRMED', 'RESCHEDULED')
+
+
+def backfill_current_appointments(apps, schema_editor):
+    # Start the counter from the doctor's active appointments; the booking paths adjust it from here.
+    DoctorProfile = apps.get_model('accounts', 'DoctorProfile')
+    Appointment = apps.get_model('appointments', 'Appointment')
+    active = Appointment.objects.filter(
+        doctor_id=OuterRef('user_id'), status__in=ACTIVE_STATUSES
+    ).order_by().values('doctor_id').annotate(total=Count('id')).values('total')
+    DoctorProfile.objects.update(
+        current_appointments=Coalesce(Subquery(active, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_doctorprofile_patientprofile'),
+        ('appointments', '0013_backfill_day_schedules'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_current_appointments, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from .models import CustomUser, DoctorProfile, PatientProfile
+from . import capacity
 
 @receiver(post_save, sender=CustomUser)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -16,3 +17,7 @@ def save_user_profile(sender, instance, **kwargs):
         instance.doctor_profile.save()
     elif instance.role == 'patient' and hasattr(instance, 'patient_profile'):
         instance.patient_profile.save()
+
+@receiver([post_save, post_delete], sender=DoctorProfile)
+def invalidate_doctor_capacity(sender, instance, **kwargs):
+    capacity.invalidate(instance.user_id)
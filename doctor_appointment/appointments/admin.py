@@ -1,7 +1,8 @@
 
 
 from django.contrib import admin
-from .models import Appointment
+from .models import Appointment, ArchivedAppointment, CalendarFeed, DoctorDayStats, DoctorDaySchedule, WaitlistOffer
+from .services import bulk_cancel
 
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ('id', 'doctor', 'patient', 'appointment_date', 'status')
@@ -9,6 +10,53 @@ class AppointmentAdmin(admin.ModelAdmin):
     search_fields = ('doctor__name', 'patient__name', 'appointment_date')
     ordering = ('-appointment_date',)
     date_hierarchy = 'appointment_date'
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('appointment_day', 'version', 'created_at', 'updated_at')
+    actions = ['cancel_selected']
+
+    def has_change_permission(self, request, obj=None):
+        # A form save writes the whole row without bumping the version or the day index;
+        # existing appointments change through the cancel action and the API transitions.
+        return obj is None and super().has_change_permission(request, obj)
+
+    @admin.action(description="Cancel selected appointments", permissions=['change'])
+    def cancel_selected(self, request, queryset):
+        canceled = bulk_cancel(queryset)
+        self.message_user(request, f"Canceled {len(canceled)} appointment(s).")
 
 admin.site.register(Appointment, AppointmentAdmin)
+
+class ArchivedAppointmentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'doctor', 'patient', 'appointment_date', 'status', 'archived_at')
+    list_filter = ('status',)
+    ordering = ('-appointment_date',)
+    date_hierarchy = 'appointment_date'
+
+admin.site.register(ArchivedAppointment, ArchivedAppointmentAdmin)
+
+class DoctorDayScheduleAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'date', 'confirmed_count', 'booked_slots', 'updated_at')
+    list_filter = ('date',)
+    ordering = ('-date',)
+
+admin.site.register(DoctorDaySchedule, DoctorDayScheduleAdmin)
+
+class WaitlistOfferAdmin(admin.ModelAdmin):
+    list_display = ('id', 'appointment', 'status', 'expires_at', 'created_at')
+    list_filter = ('status',)
+    ordering = ('-created_at',)
+
+admin.site.register(WaitlistOffer, WaitlistOfferAdmin)
+
+class CalendarFeedAdmin(admin.ModelAdmin):
+    list_display = ('user', 'created_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('token', 'created_at')
+
+admin.site.register(CalendarFeed, CalendarFeedAdmin)
+
+class DoctorDayStatsAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'date', 'booked', 'confirmed', 'canceled', 'revenue', 'refreshed_at')
+    list_filter = ('date',)
+    ordering = ('-date',)
+
+admin.site.register(DoctorDayStats, DoctorDayStatsAdmin)
@@ -0,0 +1,50 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Appointment, ArchivedAppointment, DoctorDaySchedule
+
+ARCHIVED_FIELDS = ('id', 'doctor_id', 'patient_id', 'appointment_date', 'status', 'created_at', 'updated_at')
+
+
+def archive_cutoff(days=None):
+    days = settings.APPOINTMENT_ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_batch(cutoff, batch_size=None):
+    """
+    Move up to batch_size appointments dated before cutoff into the archive table
+    in one transaction. Rows are claimed with SKIP LOCKED, so a concurrent run or a
+    live update never blocks the job. Returns the number of rows moved.
+    """
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    with transaction.atomic():
+        rows = list(
+            Appointment.objects.select_for_update(skip_locked=True)
+            .filter(appointment_date__lt=cutoff)
+            # Walk the (appointment_date, id) index from the oldest row, so the range scan
+            # stops at the cutoff and the final empty batch reads no rows at all.
+            .order_by('appointment_date', 'id')
+            .values(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ArchivedAppointment.objects.bulk_create(
+            [ArchivedAppointment(**row) for row in rows], ignore_conflicts=True
+        )
+        # Through the ORM so cascades (waitlist offers) and cache invalidation still run.
+        Appointment.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def prune_schedules(cutoff):
+    # Availability index rows for archived days are never read again.
+    return DoctorDaySchedule.objects.filter(date__lt=timezone.localdate(cutoff)).delete()[0]
+
+
+def history_for(user):
+    # Mirrors AppointmentViewSet.get_queryset for the archive table.
+    if getattr(user, "is_doctor", False):
+        return ArchivedAppointment.objects.filter(doctor=user)
+    return ArchivedAppointment.objects.filter(patient=user)
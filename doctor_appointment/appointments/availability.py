@@ -0,0 +1,201 @@
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+from accounts.capacity import max_appointments
+from .models import Appointment, DoctorDaySchedule
+
+
+def slot_grid():
+    # All slot start times of a working day, e.g. ["08:00", "08:20", ...].
+    start = datetime.strptime(settings.APPOINTMENT_DAY_START, '%H:%M')
+    end = datetime.strptime(settings.APPOINTMENT_DAY_END, '%H:%M')
+    step = timedelta(minutes=settings.APPOINTMENT_SLOT_MINUTES)
+    slots = []
+    while start < end:
+        slots.append(start.strftime('%H:%M'))
+        start += step
+    return slots
+
+
+def slot_key(appointment_date):
+    # Map an aware datetime to the (day, "HH:MM") pair used by the index.
+    local = timezone.localtime(appointment_date)
+    return local.date(), local.strftime('%H:%M')
+
+
+def on_grid(appointment_date):
+    # True when the datetime is exactly one of the day's slot start times.
+    local = timezone.localtime(appointment_date)
+    return not (local.second or local.microsecond) and local.strftime('%H:%M') in slot_grid()
+
+
+def lock_day(doctor_id, day):
+    """
+    Return the doctor's schedule row for the day locked with SELECT ... FOR UPDATE.
+    Must be called inside a transaction; it serializes writers of that doctor-day only.
+    """
+    DoctorDaySchedule.objects.get_or_create(doctor_id=doctor_id, date=day)
+    return DoctorDaySchedule.objects.select_for_update().get(doctor_id=doctor_id, date=day)
+
+
+def mark_booked(doctor_id, appointment_date, status):
+    day, slot = slot_key(appointment_date)
+    with transaction.atomic():
+        schedule = lock_day(doctor_id, day)
+        if slot not in schedule.booked_slots:
+            schedule.booked_slots = sorted(schedule.booked_slots + [slot])
+        if status == 'CONFIRMED':
+            schedule.confirmed_count += 1
+        schedule.save(update_fields=['booked_slots', 'confirmed_count', 'updated_at'])
+
+
+def mark_released(doctor_id, appointment_date, status):
+    # `status` is the status the appointment had before it released the slot.
+    if status not in Appointment.ACTIVE_STATUSES:
+        return
+    day, slot = slot_key(appointment_date)
+    with transaction.atomic():
+        schedule = lock_day(doctor_id, day)
+        schedule.booked_slots = [s for s in schedule.booked_slots if s != slot]
+        if status == 'CONFIRMED' and schedule.confirmed_count:
+            schedule.confirmed_count -= 1
+        schedule.save(update_fields=['booked_slots', 'confirmed_count', 'updated_at'])
+
+
+def mark_moved(doctor_id, old_date, old_status, new_date, new_status):
+    with transaction.atomic():
+        # Lock both days in date order so concurrent moves cannot deadlock.
+        for day in sorted({slot_key(old_date)[0], slot_key(new_date)[0]}):
+            lock_day(doctor_id, day)
+        mark_released(doctor_id, old_date, old_status)
+        mark_booked(doctor_id, new_date, new_status)
+
+
+def confirmed_count(doctor_id, day):
+    # Unique (doctor, date) lookup on the counter row; no scan of the appointments table.
+    return DoctorDaySchedule.objects.filter(
+        doctor_id=doctor_id, date=day
+    ).values_list('confirmed_count', flat=True).first() or 0
+
+
+def rebuild_day(doctor_id, day):
+    """
+    Recompute a doctor's day from the appointments table. Used after bulk updates
+    that bypass the per-appointment hooks.
+    """
+    with transaction.atomic():
+        schedule = lock_day(doctor_id, day)
+        rows = Appointment.objects.on_day(day).filter(
+            doctor_id=doctor_id,
+            status__in=Appointment.ACTIVE_STATUSES
+        ).values_list('appointment_date', 'status')
+        schedule.booked_slots = sorted({slot_key(value)[1] for value, _ in rows})
+        schedule.confirmed_count = sum(1 for _, status in rows if status == 'CONFIRMED')
+        schedule.save(update_fields=['booked_slots', 'confirmed_count', 'updated_at'])
+
+
+def open_slots(doctor_id, date_from, date_to):
+    """
+    Return [{"date": day, "open_slots": [...]}, ...] for every day in the range,
+    reading the index with a single query.
+    """
+    booked = {
+        day: (slots, confirmed)
+        for day, slots, confirmed in DoctorDaySchedule.objects.filter(
+            doctor_id=doctor_id, date__range=(date_from, date_to)
+        ).values_list('date', 'booked_slots', 'confirmed_count')
+    }
+    grid = slot_grid()
+    limit = max_appointments(doctor_id)
+    now = timezone.localtime()
+    days = []
+    day = date_from
+    while day <= date_to:
+        slots, confirmed = booked.get(day, ((), 0))
+        taken = set(slots)
+        if confirmed >= limit:
+            free = []
+        else:
+            free = [slot for slot in grid if slot not in taken]
+        if day == now.date():
+            current = now.strftime('%H:%M')
+            free = [slot for slot in free if slot > current]
+        days.append({"date": day, "open_slots": free})
+        day += timedelta(days=1)
+    return days
+
+
+def is_taken(booked_slots, slot):
+    # booked_slots is kept sorted, so membership is a binary search.
+    i = bisect_left(booked_slots, slot)
+    return i < len(booked_slots) and booked_slots[i] == slot
+
+
+def free_slots_from(doctor_id, start, until):
+    """
+    Yield the doctor's free slot datetimes at or after `start` and no later than
+    `until`, earliest first. The index for the whole range is read with one query;
+    callers must still claim a slot under the day lock, as this is only a snapshot.
+    """
+    first_day = timezone.localtime(start).date()
+    last_day = timezone.localtime(until).date()
+    booked = dict(DoctorDaySchedule.objects.filter(
+        doctor_id=doctor_id, date__range=(first_day, last_day)
+    ).values_list('date', 'booked_slots'))
+    grid = slot_grid()
+    day = first_day
+    while day <= last_day:
+        slots = booked.get(day, [])
+        # Skip straight to the requested time on the first day.
+        begin = bisect_left(grid, timezone.localtime(start).strftime('%H:%M')) if day == first_day else 0
+        for slot in grid[begin:]:
+            if is_taken(slots, slot):
+                continue
+            when = timezone.make_aware(datetime.combine(day, time.fromisoformat(slot)))
+            if when > until:
+                return
+            if when >= start:
+                yield when
+        day += timedelta(days=1)
+
+
+def schedule_grid(doctor_id, date_from, date_to):
+    """
+    Column-oriented schedule of a doctor's days: one entry per day in every list.
+    Counts come from a single query grouped by (appointment_day, status) on the
+    doctor/day/status index; booked times ride along from the day's index row.
+    """
+    booked_slots = DoctorDaySchedule.objects.filter(
+        doctor_id=doctor_id, date=OuterRef('appointment_day')
+    ).values('booked_slots')[:1]
+    rows = Appointment.objects.filter(
+        doctor_id=doctor_id, appointment_day__range=(date_from, date_to)
+    ).values('appointment_day', 'status').annotate(
+        total=Count('id'),
+        booked=Subquery(booked_slots, output_field=models.JSONField()),
+    ).order_by()
+    statuses = [value for value, _ in Appointment.STATUS_CHOICES]
+    limit = max_appointments(doctor_id)
+    days = []
+    day = date_from
+    while day <= date_to:
+        days.append(day)
+        day += timedelta(days=1)
+    position = {day: i for i, day in enumerate(days)}
+    counts = [[0] * len(statuses) for _ in days]
+    booked = [[] for _ in days]
+    for row in rows:
+        i = position[row['appointment_day']]
+        counts[i][statuses.index(row['status'])] = row['total']
+        booked[i] = row['booked'] or []
+    confirmed = statuses.index('CONFIRMED')
+    return {
+        "statuses": statuses,
+        "days": days,
+        "counts": counts,
+        "remaining": [max(limit - day_counts[confirmed], 0) for day_counts in counts],
+        "booked": booked,
+    }
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class LocalLRU:
+    """Small thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_local = LocalLRU(settings.APPOINTMENT_CACHE_LOCAL_SIZE)
+
+
+def _version_key(user_id):
+    return f'appointments:version:{user_id}'
+
+
+def user_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Seed from the clock so an evicted counter never falls back to a version
+        # that may still have responses cached under it.
+        version = time.time_ns()
+        cache.add(_version_key(user_id), version, None)
+        version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def bump_versions(user_ids):
+    """
+    Invalidate every cached appointment response of the given users. Runs after
+    commit so readers never cache pre-commit data under the new version.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id}
+
+    def bump():
+        for user_id in user_ids:
+            try:
+                cache.incr(_version_key(user_id))
+            except ValueError:
+                cache.set(_version_key(user_id), time.time_ns(), None)
+
+    transaction.on_commit(bump)
+
+
+def response_key(request):
+    user = request.user
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'appointments:response:{user.pk}:{getattr(user, "role", "")}:{user_version(user.pk)}:{path}'
+
+
+def get_response(request):
+    """
+    Return (key, payload) for the request, checking the in-process LRU before the
+    shared cache. Pass the same key to set_response so a response built from
+    data read before an invalidation is never stored under the newer version.
+    """
+    key = response_key(request)
+    payload = _local.get(key)
+    if payload is None:
+        payload = cache.get(key)
+        if payload is not None:
+            _local.set(key, payload, settings.APPOINTMENT_CACHE_TTL)
+    return key, payload
+
+
+def set_response(key, payload):
+    cache.set(key, payload, settings.APPOINTMENT_CACHE_TTL)
+    _local.set(key, payload, settings.APPOINTMENT_CACHE_TTL)
@@ -0,0 +1,42 @@
+import hashlib
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def make_etag(request, *parts):
+    # Validators are per user and per URL (filters, cursor, fields all change the body).
+    raw = '|'.join(str(part) for part in (request.user.pk, request.get_full_path(), *parts))
+    return '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+
+def list_etag(request, queryset):
+    """
+    One aggregate over the filtered queryset. Any insert, update or delete in the
+    result set moves either the latest updated_at or the row count.
+    """
+    stats = queryset.order_by().aggregate(last=Max('updated_at'), total=Count('id'))
+    last = stats['last'].isoformat() if stats['last'] else ''
+    return make_etag(request, last, stats['total'])
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Return a 304 (or 412 for a failed If-Match) response if the client's
+    validators still match, otherwise None.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    conditional = get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+    if conditional is None:
+        return None
+    response = Response(status=conditional.status_code)
+    return with_validators(response, etag, last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ('Authorization',))
+    return response
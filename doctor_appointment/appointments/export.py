@@ -0,0 +1,126 @@
+import csv
+import json
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain, islice
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from payments.models import Payment
+from .models import Appointment, ArchivedAppointment
+
+# (column name, lookup) pairs.
+APPOINTMENT_COLUMNS = [
+    ('appointment_id', 'id'),
+    ('appointment_date', 'appointment_date'),
+    ('status', 'status'),
+    ('doctor_id', 'doctor_id'),
+    ('doctor', 'doctor__username'),
+    ('patient_id', 'patient_id'),
+    ('patient', 'patient__username'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+PAYMENT_COLUMNS = [
+    ('payment_id', 'id'),
+    ('payment_amount', 'amount'),
+    ('payment_currency', 'currency'),
+    ('payment_status', 'status'),
+    ('payment_transaction_id', 'transaction_id'),
+    ('payment_created_at', 'created_at'),
+]
+# Payments are LEFT JOINed, so an appointment with several payments yields one row
+# per payment and one without yields empty payment columns.
+COLUMNS = APPOINTMENT_COLUMNS + [(name, f'payments__{lookup}') for name, lookup in PAYMENT_COLUMNS]
+FORMATS = ('csv', 'jsonl')
+encoder = DjangoJSONEncoder()
+
+
+def in_range(queryset, date_from=None, date_to=None):
+    if date_from:
+        queryset = queryset.filter(appointment_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(appointment_date__lt=date_to)
+    return queryset
+
+
+def export_rows(date_from=None, date_to=None):
+    """
+    Appointment x Payment rows as tuples, read through a server-side cursor in
+    EXPORT_CHUNK_SIZE batches: archived appointments first, then the live table.
+    Each part is ordered by primary key so PostgreSQL can start returning rows
+    without sorting the whole table first.
+    """
+    live = in_range(Appointment.objects.all(), date_from, date_to).order_by('id', 'payments__id').values_list(
+        *[lookup for _, lookup in COLUMNS]
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    return chain(archived_rows(date_from, date_to), live)
+
+
+def archived_rows(date_from=None, date_to=None):
+    # Payment.appointment points at the live table, so archived rows get their payments
+    # with one IN query per chunk instead of a join.
+    rows = in_range(ArchivedAppointment.objects.all(), date_from, date_to).order_by('id').values_list(
+        *[lookup for _, lookup in APPOINTMENT_COLUMNS]
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    no_payment = (None,) * len(PAYMENT_COLUMNS)
+    while True:
+        chunk = list(islice(rows, settings.EXPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        payments = defaultdict(list)
+        for appointment_id, *payment in Payment.objects.filter(
+            appointment_id__in=[row[0] for row in chunk]
+        ).order_by('id').values_list('appointment_id', *[lookup for _, lookup in PAYMENT_COLUMNS]):
+            payments[appointment_id].append(tuple(payment))
+        for row in chunk:
+            for payment in payments.get(row[0]) or [no_payment]:
+                yield row + payment
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        # Same timestamp format as the JSON Lines output.
+        return encoder.default(value)
+    return value
+
+
+class Echo:
+    # csv.writer target that hands each formatted line back instead of buffering it.
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in COLUMNS])
+    for row in rows:
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+def jsonl_lines(rows):
+    names = [name for name, _ in COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), default=encoder.default) + '\n'
+
+
+def stream_export(rows, fmt, compress=False):
+    """
+    Yield the export as bytes, a cursor chunk of rows at a time, optionally gzip
+    compressed on the fly.
+    """
+    lines = csv_lines(rows) if fmt == 'csv' else jsonl_lines(rows)
+    # wbits=31 writes a gzip header and trailer around the deflate stream.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    while True:
+        data = ''.join(islice(lines, settings.EXPORT_CHUNK_SIZE)).encode()
+        if not data:
+            break
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
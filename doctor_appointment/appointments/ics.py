@@ -0,0 +1,92 @@
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from .models import Appointment
+
+# RFC 5545 event status for each appointment status.
+EVENT_STATUS = {
+    'PENDING': 'TENTATIVE',
+    'CONFIRMED': 'CONFIRMED',
+    'RESCHEDULED': 'CONFIRMED',
+    'CANCELED': 'CANCELLED',
+}
+
+
+def feed_queryset(user):
+    # Doctors subscribe to the appointments they hold, everyone else to their own bookings.
+    since = timezone.now() - timedelta(days=settings.CALENDAR_FEED_PAST_DAYS)
+    if getattr(user, "is_doctor", False):
+        queryset = Appointment.objects.filter(doctor=user)
+    else:
+        queryset = Appointment.objects.filter(patient=user)
+    return queryset.filter(appointment_date__gte=since)
+
+
+def feed_etag(user, queryset):
+    # Same validator as the JSON list: latest updated_at plus row count, in one aggregate.
+    stats = queryset.order_by().aggregate(last=Max('updated_at'), total=Count('id'))
+    last = stats['last'].isoformat() if stats['last'] else ''
+    raw = f'{user.pk}|{last}|{stats["total"]}|{settings.CALENDAR_FEED_PAST_DAYS}'
+    return '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+
+def escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def fold(line):
+    # Content lines are limited to 75 octets; continuations start with a space.
+    raw = line.encode()
+    parts = []
+    while len(raw) > 75:
+        cut = 75 if not parts else 74
+        # Never split a multi-byte character.
+        while cut and (raw[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(raw[:cut].decode())
+        raw = raw[cut:]
+    parts.append(raw.decode())
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def utc_stamp(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def iter_calendar(user, queryset):
+    """
+    Yield the feed as iCalendar text, one event at a time. Rows are read through a
+    server-side cursor in CALENDAR_FEED_CHUNK_SIZE batches, so memory stays flat
+    however long the schedule is.
+    """
+    doctor_view = getattr(user, "is_doctor", False)
+    other = 'patient__username' if doctor_view else 'doctor__username'
+    length = timedelta(minutes=settings.APPOINTMENT_SLOT_MINUTES)
+    yield (
+        'BEGIN:VCALENDAR\r\n'
+        'VERSION:2.0\r\n'
+        'PRODID:-//Doctor Visit App//Appointments//EN\r\n'
+        'CALSCALE:GREGORIAN\r\n'
+        'METHOD:PUBLISH\r\n'
+        'X-WR-CALNAME:Appointments\r\n'
+    )
+    rows = queryset.order_by('appointment_date', 'id').values_list(
+        'id', 'appointment_date', 'status', 'updated_at', other
+    ).iterator(chunk_size=settings.CALENDAR_FEED_CHUNK_SIZE)
+    for pk, start, status, updated_at, name in rows:
+        summary = f'Appointment with {name}' if doctor_view else f'Appointment with Dr. {name}'
+        yield (
+            'BEGIN:VEVENT\r\n'
+            f'UID:appointment-{pk}@doctor-visit-app\r\n'
+            f'DTSTAMP:{utc_stamp(updated_at)}\r\n'
+            f'LAST-MODIFIED:{utc_stamp(updated_at)}\r\n'
+            f'DTSTART:{utc_stamp(start)}\r\n'
+            f'DTEND:{utc_stamp(start + length)}\r\n'
+            + fold(f'SUMMARY:{escape(summary)}')
+            + f'STATUS:{EVENT_STATUS.get(status, "CONFIRMED")}\r\n'
+            'END:VEVENT\r\n'
+        )
+    yield 'END:VCALENDAR\r\n'
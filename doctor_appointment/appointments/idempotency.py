@@ -0,0 +1,112 @@
+import hashlib
+import json
+import secrets
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCacheClient
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.1
+# Delete the lock only if it still holds our token, in one step on the Redis server.
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _cache_key(request, key):
+    # Scoped per user and endpoint, so one client's key can never replay another's response.
+    raw = '|'.join((str(request.user.pk), request.method, request.path, key))
+    return 'idempotency:%s' % hashlib.sha256(raw.encode()).hexdigest()
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def replay(stored, request_fingerprint):
+    code, data, stored_fingerprint = stored
+    if stored_fingerprint != request_fingerprint:
+        return Response({"detail": f"{HEADER} was already used with a different request body."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(data, status=code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def wait_for(result_key, request_fingerprint):
+    """
+    Poll briefly (IDEMPOTENCY_WAIT_SECONDS) for the response of an in-flight duplicate,
+    then answer 409 so the client retries instead of holding the worker.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        stored = cache.get(result_key)
+        if stored is not None:
+            return replay(stored, request_fingerprint)
+    return Response({"detail": f"A request with this {HEADER} is still in progress. Retry shortly."},
+                    status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+
+
+def release(lock_key, token):
+    # A handler that outlived IDEMPOTENCY_LOCK_SECONDS must not drop a lock a duplicate has since taken.
+    if isinstance(getattr(cache, '_cache', None), RedisCacheClient):
+        key = cache.make_and_validate_key(lock_key)
+        cache._cache.get_client(key, write=True).eval(RELEASE_SCRIPT, 1, key, token)
+    elif cache.get(lock_key) == token:
+        # Other backends have no compare-and-delete; the lock could change hands between
+        # the two calls, which is accepted for local and test setups.
+        cache.delete(lock_key)
+
+
+def idempotent(view_method):
+    """
+    Make a POST handler safe to retry. The first response for a user's
+    Idempotency-Key is stored for IDEMPOTENCY_TTL_SECONDS and replayed to retries
+    without running the handler again. A cache.add lock marks the key in flight,
+    so a concurrent duplicate waits for that response instead of repeating the
+    work. Server errors, and exceptions left to DRF's handler, are not stored, so
+    the key can be retried after them.
+    Requests without the header are handled as before.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"detail": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        result_key = _cache_key(request, key)
+        lock_key = f'{result_key}:lock'
+        request_fingerprint = fingerprint(request)
+
+        stored = cache.get(result_key)
+        if stored is not None:
+            return replay(stored, request_fingerprint)
+        # An int, so the Redis backend stores it unpickled and RELEASE_SCRIPT can compare it.
+        token = secrets.randbits(63)
+        if not cache.add(lock_key, token, settings.IDEMPOTENCY_LOCK_SECONDS):
+            return wait_for(result_key, request_fingerprint)
+        try:
+            # The previous holder may have finished between our get and add.
+            stored = cache.get(result_key)
+            if stored is not None:
+                return replay(stored, request_fingerprint)
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code < 500:
+                cache.set(result_key, (response.status_code, response.data, request_fingerprint),
+                          settings.IDEMPOTENCY_TTL_SECONDS)
+            return response
+        finally:
+            release(lock_key, token)
+    return wrapper
@@ -0,0 +1,218 @@
+import csv
+import io
+import json
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import reduce
+from itertools import islice
+from operator import or_
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from accounts.capacity import adjust_current_appointments, max_appointments
+from .availability import on_grid, slot_key
+from .cache import bump_versions
+from .models import Appointment, DoctorDaySchedule
+from .serializers import SLOT_GRID_ERROR
+
+User = get_user_model()
+
+IMPORT_STATUSES = ('PENDING', 'CONFIRMED')
+
+
+def read_rows(stream, fmt):
+    """Yield row dicts from a CSV (with header) or JSON Lines text stream."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Reported against its row number by parse_row.
+                    yield None
+
+
+def parse_row(row, now):
+    """Return (fields, errors) for one input row; fields is None if it is unusable."""
+    if not isinstance(row, dict):
+        return None, ["row: expected an object with doctor, patient and appointment_date."]
+    errors = []
+    fields = {}
+    for name in ('doctor', 'patient'):
+        value = str(row.get(name) or '').strip()
+        if not value.isdigit():
+            errors.append(f"{name}: a numeric user id is required.")
+        else:
+            fields[f'{name}_id'] = int(value)
+    try:
+        when = parse_datetime(str(row.get('appointment_date') or '').strip())
+    except ValueError:
+        when = None
+    if when is None:
+        errors.append("appointment_date: invalid or missing ISO datetime.")
+    else:
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        if when < now:
+            errors.append("appointment_date: must be in the future.")
+        elif when > now + timedelta(days=settings.APPOINTMENT_BOOKING_WINDOW_DAYS):
+            errors.append(f"appointment_date: must be within {settings.APPOINTMENT_BOOKING_WINDOW_DAYS} days.")
+        if not on_grid(when):
+            errors.append(f"appointment_date: {SLOT_GRID_ERROR}")
+        fields['appointment_date'] = when
+    status = str(row.get('status') or 'CONFIRMED').strip().upper()
+    if status not in IMPORT_STATUSES:
+        errors.append(f"status: must be one of {', '.join(IMPORT_STATUSES)}.")
+    fields['status'] = status
+    return (None if errors else fields), errors
+
+
+class AppointmentImporter:
+    """
+    Validate and insert appointments in batches. Each batch costs a fixed number of
+    queries whatever its size: users are checked with one IN query, duplicate slots
+    inside the file are caught in memory, the affected doctor-day rows are locked
+    with one SELECT ... FOR UPDATE and checked for taken slots and daily caps, and
+    the survivors go in with a single bulk_create. Bad rows are reported, not fatal.
+    """
+
+    def __init__(self, batch_size=None, dry_run=False):
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.dry_run = dry_run
+        self.created = 0
+        self.errors = []
+        # (doctor_id, (day, slot)) of every accepted row so far, across batches.
+        self.seen = set()
+
+    def run(self, rows):
+        numbered = enumerate(rows, start=1)
+        while True:
+            batch = list(islice(numbered, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+        self.errors.sort(key=lambda error: error['row'])
+        return {"created": self.created, "errors": self.errors}
+
+    def reject(self, number, *messages):
+        self.errors.append({"row": number, "errors": list(messages)})
+
+    def import_batch(self, batch):
+        now = timezone.now()
+        parsed = []
+        for number, row in batch:
+            fields, errors = parse_row(row, now)
+            if errors:
+                self.reject(number, *errors)
+            else:
+                parsed.append((number, fields))
+
+        doctor_ids = {fields['doctor_id'] for _, fields in parsed}
+        patient_ids = {fields['patient_id'] for _, fields in parsed}
+        doctors = set(User.objects.filter(id__in=doctor_ids, role='doctor').values_list('id', flat=True))
+        patients = set(User.objects.filter(id__in=patient_ids).values_list('id', flat=True))
+
+        candidates = []
+        for number, fields in parsed:
+            key = slot_key(fields['appointment_date'])
+            if fields['doctor_id'] not in doctors:
+                self.reject(number, "doctor: no doctor with this id.")
+            elif fields['patient_id'] not in patients:
+                self.reject(number, "patient: no user with this id.")
+            elif (fields['doctor_id'], key) in self.seen:
+                self.reject(number, "appointment_date: duplicate slot earlier in the file.")
+            else:
+                candidates.append((number, fields, key))
+        if candidates:
+            with transaction.atomic():
+                self.insert(candidates)
+                if self.dry_run:
+                    transaction.set_rollback(True)
+
+    def insert(self, candidates):
+        pairs = sorted({(fields['doctor_id'], day) for _, fields, (day, _) in candidates})
+        DoctorDaySchedule.objects.bulk_create(
+            [DoctorDaySchedule(doctor_id=doctor_id, date=day) for doctor_id, day in pairs],
+            ignore_conflicts=True,
+        )
+        # Lock every affected doctor-day in one ordered query, as lock_day does one at a time.
+        schedules = {
+            (schedule.doctor_id, schedule.date): schedule
+            for schedule in DoctorDaySchedule.objects.select_for_update().filter(
+                reduce(or_, (Q(doctor_id=doctor_id, date=day) for doctor_id, day in pairs))
+            ).order_by('doctor_id', 'date')
+        }
+        accepted = []
+        booked = defaultdict(set)
+        confirmed = Counter()
+        for number, fields, (day, slot) in candidates:
+            pair = (fields['doctor_id'], day)
+            schedule = schedules[pair]
+            if slot in booked[pair]:
+                self.reject(number, "appointment_date: duplicate slot earlier in the file.")
+                continue
+            if slot in schedule.booked_slots:
+                self.reject(number, "appointment_date: this time slot is already booked.")
+                continue
+            if fields['status'] == 'CONFIRMED':
+                if schedule.confirmed_count + confirmed[pair] >= max_appointments(fields['doctor_id']):
+                    self.reject(number, "Doctor has reached the maximum number of appointments for this day.")
+                    continue
+                confirmed[pair] += 1
+            booked[pair].add(slot)
+            # Only rows that pass every check claim the slot for later rows in the file.
+            self.seen.add((fields['doctor_id'], (day, slot)))
+            accepted.append((number, Appointment(**fields)))
+        if not accepted:
+            return
+        try:
+            with transaction.atomic():
+                Appointment.objects.bulk_create([appointment for _, appointment in accepted])
+        except IntegrityError:
+            # The index and the table disagree; fall back to row-by-row inserts to find the culprit.
+            accepted = self.insert_one_by_one(accepted, booked, confirmed)
+
+        stamp = timezone.now()
+        for pair, slots in booked.items():
+            schedule = schedules[pair]
+            schedule.booked_slots = sorted(set(schedule.booked_slots) | slots)
+            schedule.confirmed_count += confirmed[pair]
+            schedule.updated_at = stamp
+        DoctorDaySchedule.objects.bulk_update(
+            [schedules[pair] for pair in booked], ['booked_slots', 'confirmed_count', 'updated_at']
+        )
+        for doctor_id, count in Counter(a.doctor_id for _, a in accepted).items():
+            adjust_current_appointments(doctor_id, count)
+        # bulk_create skips post_save, so invalidate cached lists here.
+        bump_versions({a.doctor_id for _, a in accepted} | {a.patient_id for _, a in accepted})
+        self.created += len(accepted)
+
+    def insert_one_by_one(self, accepted, booked, confirmed):
+        inserted = []
+        for number, appointment in accepted:
+            try:
+                with transaction.atomic():
+                    appointment.save(force_insert=True)
+            except IntegrityError:
+                day, slot = slot_key(appointment.appointment_date)
+                pair = (appointment.doctor_id, day)
+                booked[pair].discard(slot)
+                self.seen.discard((appointment.doctor_id, (day, slot)))
+                if appointment.status == 'CONFIRMED':
+                    confirmed[pair] -= 1
+                self.reject(number, "appointment_date: this time slot is already booked.")
+                continue
+            inserted.append((number, appointment))
+        return inserted
+
+
+def import_file(data, fmt, **options):
+    """Import from uploaded bytes or text in csv or jsonl format."""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    return AppointmentImporter(**options).run(read_rows(io.StringIO(data), fmt))
@@ -0,0 +1,42 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from appointments.archive import archive_batch, archive_cutoff, prune_schedules
+from appointments.models import Appointment
+
+
+class Command(BaseCommand):
+    help = (
+        "Move appointments older than APPOINTMENT_ARCHIVE_AFTER_DAYS from the hot table "
+        "to the archive table in short batches, keeping the live table and its indexes "
+        "small. Safe to run from cron while the API is serving traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.APPOINTMENT_ARCHIVE_AFTER_DAYS,
+                            help='Archive appointments dated more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=0, help='Stop after this many batches (0: no limit).')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would move.')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['older_than'])
+        if options['dry_run']:
+            count = Appointment.objects.filter(appointment_date__lt=cutoff).count()
+            self.stdout.write(f"{count} appointments dated before {cutoff:%Y-%m-%d %H:%M} would be archived.")
+            return
+        moved = batches = 0
+        while not options['max_batches'] or batches < options['max_batches']:
+            count = archive_batch(cutoff, options['batch_size'])
+            if not count:
+                break
+            moved += count
+            batches += 1
+            self.stdout.write(f"batch {batches}: archived {count} ({moved} total)")
+            if options['pause']:
+                time.sleep(options['pause'])
+        pruned = prune_schedules(cutoff)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} appointments in {batches} batches; pruned {pruned} schedule rows."
+        ))
@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from accounts.capacity import max_appointments
+from appointments.models import Appointment
+from appointments.services import BookingError, book_appointment
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency stress benchmark for the booking service: fires parallel bookings "
+        "at the same doctor-days and fails if any day ends up over the daily cap. "
+        "Run against PostgreSQL; it creates and removes its own bench_* users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Booking attempts per doctor.')
+        parser.add_argument('--workers', type=int, default=50, help='Parallel threads.')
+        parser.add_argument('--doctors', type=int, default=1, help='Doctors booked in parallel.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("bench_booking needs PostgreSQL row locks; current backend is %s." % connection.vendor)
+        requests, doctors = options['requests'], options['doctors']
+        run_id = int(time.time())
+        users = User.objects.bulk_create(
+            [User(username=f'bench_{run_id}_doctor_{i}', role='doctor') for i in range(doctors)]
+            + [User(username=f'bench_{run_id}_patient', role='patient')]
+        )
+        patient = users.pop()
+        day = timezone.localdate() + timedelta(days=5)
+        start = timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(hours=8)
+        # Every attempt targets a distinct minute so only the daily cap can reject it.
+        jobs = [(doctor, start + timedelta(minutes=i)) for doctor in users for i in range(requests)]
+
+        def attempt(job):
+            doctor, when = job
+            try:
+                book_appointment(doctor=doctor, patient=patient, appointment_date=when, status='CONFIRMED')
+                return True
+            except BookingError:
+                return False
+            finally:
+                connection.close()
+
+        try:
+            began = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                booked = sum(pool.map(attempt, jobs))
+            elapsed = time.perf_counter() - began
+
+            overbooked = []
+            for doctor in users:
+                count = Appointment.objects.filter(doctor=doctor, status='CONFIRMED').count()
+                if count > max_appointments(doctor.id):
+                    overbooked.append((doctor.username, count))
+            self.stdout.write(
+                f"{len(jobs)} attempts, {booked} booked in {elapsed:.2f}s "
+                f"({len(jobs) / elapsed:.0f} req/s) across {doctors} doctor(s)"
+            )
+            if overbooked:
+                raise CommandError(f"Overbooking detected: {overbooked}")
+            self.stdout.write(self.style.SUCCESS("No doctor-day exceeded the daily cap."))
+        finally:
+            User.objects.filter(username__startswith=f'bench_{run_id}_').delete()
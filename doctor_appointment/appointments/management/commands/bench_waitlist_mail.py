@@ -0,0 +1,111 @@
+import socketserver
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from appointments.models import Waitlist
+from appointments.tasks import availability_messages, send_in_batches
+
+User = get_user_model()
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP server that accepts and discards every message."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 sink ready')
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode(errors='replace').rstrip('\r\n')
+            if in_data:
+                if line == '.':
+                    in_data = False
+                    self.reply('250 OK')
+                continue
+            verb = line[:4].upper()
+            if verb == 'DATA':
+                in_data = True
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the old per-recipient waitlist mailing (one query and one SMTP connection "
+        "per patient) with the batched notify_availability path, against a local SMTP sink. "
+        "Seed data lives in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000, help='Waitlisted patients to seed.')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SinkHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+
+        def smtp():
+            return get_connection(
+                'django.core.mail.backends.smtp.EmailBackend',
+                host=host, port=port, username='', password='', use_tls=False, use_ssl=False,
+            )
+
+        try:
+            with transaction.atomic():
+                doctor_id, when = self.seed(options['patients'])
+
+                def legacy():
+                    entries = Waitlist.objects.filter(doctor_id=doctor_id, desired_date=when.date())
+                    for entry in entries:
+                        send_mail(
+                            'Appointment Slot Available',
+                            f'Dear {entry.patient.username},\n\nA slot has opened up on {when}.',
+                            settings.DEFAULT_FROM_EMAIL,
+                            [entry.patient.email],
+                            connection=smtp(),
+                        )
+
+                def batched():
+                    send_in_batches(availability_messages(doctor_id, when), options['batch_size'], smtp())
+
+                for label, run in (("per-recipient", legacy), ("batched", batched)):
+                    with CaptureQueriesContext(connection) as queries:
+                        began = time.perf_counter()
+                        run()
+                        elapsed = time.perf_counter() - began
+                    self.stdout.write(
+                        f"{label}: {options['patients']} mails in {elapsed:.2f}s "
+                        f"({options['patients'] / elapsed:.0f} msg/s), {len(queries.captured_queries)} queries"
+                    )
+                transaction.set_rollback(True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def seed(self, patients):
+        run_id = int(time.time())
+        doctor = User.objects.bulk_create([User(username=f'mailbench_{run_id}_doctor', role='doctor')])[0]
+        users = User.objects.bulk_create([
+            User(username=f'mailbench_{run_id}_{i}', email=f'patient{i}@example.com', role='patient')
+            for i in range(patients)
+        ])
+        when = timezone.now() + timedelta(days=2)
+        Waitlist.objects.bulk_create([
+            Waitlist(doctor=doctor, patient=user, desired_date=when.date()) for user in users
+        ])
+        return doctor.id, when
@@ -0,0 +1,172 @@
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from appointments.models import Appointment, DoctorDayStats, Waitlist
+from payments.models import Payment
+
+User = get_user_model()
+
+# Status mix of the seeded appointments, cycled per doctor.
+SEED_STATUSES = ['CONFIRMED'] * 4 + ['CANCELED'] * 3 + ['PENDING'] * 2 + ['RESCHEDULED']
+WAITLIST_DAYS = 30
+
+
+def index_name(model, *fields):
+    # Name of an index declared without one, e.g. Appointment's (doctor, appointment_date).
+    return next(index.name for index in model._meta.indexes if tuple(index.fields) == fields)
+
+
+def hot_queries(doctor_id, patient_id, day):
+    """
+    The queries the API and tasks run most often: label -> (queryset, index it must use).
+    Slices match the page and batch sizes the callers use.
+    """
+    now = timezone.now()
+    return {
+        "doctor list": (
+            Appointment.objects.filter(doctor_id=doctor_id).order_by('appointment_date', 'id')[:21],
+            index_name(Appointment, 'doctor', 'appointment_date'),
+        ),
+        "patient list": (
+            Appointment.objects.filter(patient_id=patient_id).order_by('appointment_date', 'id')[:21],
+            'appt_patient_date_id_idx',
+        ),
+        "doctor day": (
+            Appointment.objects.on_day(day).filter(doctor_id=doctor_id, status='CONFIRMED'),
+            'appt_doctor_day_status_idx',
+        ),
+        "upcoming live": (
+            Appointment.objects.filter(
+                status__in=['CONFIRMED', 'RESCHEDULED'],
+                appointment_date__range=(now, now + timedelta(days=1)),
+            ),
+            'appt_live_date_idx',
+        ),
+        "pending sweep": (
+            Appointment.objects.filter(status='PENDING', created_at__lt=now - timedelta(minutes=30))
+            .order_by('created_at')[:500],
+            'appt_pending_created_idx',
+        ),
+        "waitlist queue": (
+            Waitlist.objects.filter(doctor_id=doctor_id, desired_date=day).order_by('created_at')[:1],
+            'waitlist_doctor_date_idx',
+        ),
+        "open payments": (
+            Payment.objects.filter(status__in=('CREATED', 'PENDING'), created_at__lt=now - timedelta(hours=3))
+            .order_by('created_at')[:500],
+            'payment_open_created_idx',
+        ),
+        "stats range": (
+            DoctorDayStats.objects.filter(date__range=(day, day + timedelta(days=29))).order_by('date', 'doctor_id'),
+            'stats_date_doctor_idx',
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Query-plan regression check: seed representative appointments, payments, "
+        "waitlist entries and stats rows inside a rolled-back transaction, ANALYZE them, "
+        "EXPLAIN each hot query with the planner's normal settings and fail unless the "
+        "plan uses the index meant for it. PostgreSQL only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200_000, help='Appointments to seed.')
+        parser.add_argument('--doctors', type=int, default=200, help='Doctors to spread them across.')
+        parser.add_argument('--patients', type=int, default=5_000, help='Patients to spread them across.')
+        parser.add_argument('--waitlist', type=int, default=50_000, help='Waitlist entries to seed.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("check_query_plans needs PostgreSQL; current backend is %s." % connection.vendor)
+        failures = []
+        with transaction.atomic():
+            doctor_id, patient_id, day = self.seed(
+                options['rows'], options['doctors'], options['patients'], options['waitlist']
+            )
+            for label, (queryset, expected) in hot_queries(doctor_id, patient_id, day).items():
+                plan = queryset.explain()
+                table = queryset.model._meta.db_table
+                if expected in plan and f'Seq Scan on {table}' not in plan:
+                    self.stdout.write(self.style.SUCCESS(f"{label}: {expected}"))
+                    continue
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f"{label}: expected {expected}"))
+                self.stdout.write(plan)
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(f"Hot queries not served by their index: {', '.join(failures)}")
+
+    def seed(self, rows, doctors, patients, waitlist):
+        # Synthetic rows spread over a year either side of today; generate_series keeps seeding in SQL.
+        run_id = int(time.time())
+        doctor_ids = [user.id for user in User.objects.bulk_create(
+            [User(username=f'plans_{run_id}_doctor_{i}', role='doctor') for i in range(doctors)]
+        )]
+        patient_ids = [user.id for user in User.objects.bulk_create(
+            [User(username=f'plans_{run_id}_patient_{i}', role='patient') for i in range(patients)]
+        )]
+        now = timezone.now()
+        start = now - timedelta(days=365)
+        today = timezone.localdate()
+        per_doctor = -(-rows // doctors)
+        step_minutes = max(1, (730 * 24 * 60) // per_doctor)
+        created_step = max(1, (365 * 24 * 60 * 60) // rows)
+        appointments = Appointment._meta.db_table
+        payments = Payment._meta.db_table
+        waitlist_table = Waitlist._meta.db_table
+        stats = DoctorDayStats._meta.db_table
+        self.stdout.write(f"Seeding {rows} appointments...")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {appointments}
+                    (doctor_id, patient_id, appointment_date, status, created_at, updated_at)
+                SELECT (%s::bigint[])[1 + (n %% %s)], (%s::bigint[])[1 + (n %% %s)],
+                       %s::timestamptz + (n / %s) * %s * interval '1 minute',
+                       (%s::text[])[1 + ((n / %s) %% %s)],
+                       %s::timestamptz + n * %s * interval '1 second', now()
+                FROM generate_series(0, %s - 1) AS n
+                """,
+                [doctor_ids, doctors, patient_ids, patients, start, doctors, step_minutes,
+                 SEED_STATUSES, doctors, len(SEED_STATUSES), start, created_step, rows],
+            )
+            # Every other appointment has a payment; one in ten of those is still awaiting approval.
+            cursor.execute(
+                f"""
+                INSERT INTO {payments} (appointment_id, amount, currency, status, created_at, updated_at)
+                SELECT id, 50, 'USD', CASE WHEN id %% 20 = 0 THEN 'PENDING' ELSE 'COMPLETED' END,
+                       created_at, created_at
+                FROM {appointments}
+                WHERE doctor_id = ANY(%s::bigint[]) AND id %% 2 = 0
+                """,
+                [doctor_ids],
+            )
+            # Entries for the next WAITLIST_DAYS days; (doctor, patient, day) stays unique.
+            cursor.execute(
+                f"""
+                INSERT INTO {waitlist_table} (doctor_id, patient_id, desired_date, created_at)
+                SELECT (%s::bigint[])[1 + (n %% %s)], (%s::bigint[])[1 + (n / (%s * %s)) %% %s],
+                       %s::date + ((n / %s) %% %s), now() - n * interval '1 second'
+                FROM generate_series(0, %s - 1) AS n
+                """,
+                [doctor_ids, doctors, patient_ids, doctors, WAITLIST_DAYS, patients,
+                 today, doctors, WAITLIST_DAYS, min(waitlist, doctors * WAITLIST_DAYS * patients)],
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {stats}
+                    (doctor_id, date, booked, pending, confirmed, rescheduled, canceled, revenue, refreshed_at)
+                SELECT doctor_id, day::date, 0, 0, 0, 0, 0, 0, now()
+                FROM unnest(%s::bigint[]) AS doctor_id
+                CROSS JOIN generate_series(%s::date, %s::date, interval '1 day') AS day
+                """,
+                [doctor_ids, start.date(), (now + timedelta(days=365)).date()],
+            )
+            for table in (appointments, payments, waitlist_table, stats):
+                cursor.execute(f"ANALYZE {table}")
+        return doctor_ids[0], patient_ids[0], today
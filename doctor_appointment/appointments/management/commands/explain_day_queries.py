@@ -0,0 +1,77 @@
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from appointments.models import Appointment
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a large synthetic appointments table inside a rolled-back transaction and "
+        "compare EXPLAIN ANALYZE plans of appointment_date__date filters against the "
+        "stored appointment_day bucket. PostgreSQL only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000, help='Appointments to seed.')
+        parser.add_argument('--doctors', type=int, default=500, help='Doctors to spread them across.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("explain_day_queries needs PostgreSQL; current backend is %s." % connection.vendor)
+        with transaction.atomic():
+            doctor_id, day = self.seed(options['rows'], options['doctors'])
+            base = Appointment.objects.filter(doctor_id=doctor_id, status='CONFIRMED')
+            queries = [
+                ("appointment_date__date", base.filter(appointment_date__date=day)),
+                ("on_day (appointment_day)", base.on_day(day)),
+            ]
+            failed = False
+            for label, queryset in queries:
+                began = time.perf_counter()
+                plan = queryset.explain(analyze=True)
+                elapsed = (time.perf_counter() - began) * 1000
+                uses_index = 'Index' in plan and 'Seq Scan on appointments_appointment' not in plan
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{label}: {elapsed:.1f} ms, index used: {uses_index}"))
+                self.stdout.write(plan)
+                if label.startswith('on_day') and not uses_index:
+                    failed = True
+            transaction.set_rollback(True)
+        if failed:
+            raise CommandError("on_day() fell back to a sequential scan.")
+
+    def seed(self, rows, doctors):
+        # Synthetic users and appointments spread over ~2 years; generate_series keeps seeding in SQL.
+        run_id = int(time.time())
+        users = User.objects.bulk_create(
+            [User(username=f'explain_{run_id}_doctor_{i}', role='doctor') for i in range(doctors)]
+            + [User(username=f'explain_{run_id}_patient', role='patient')]
+        )
+        patient = users.pop()
+        doctor_ids = [user.id for user in users]
+        start = timezone.now() - timedelta(days=730)
+        statuses = [status for status, _ in Appointment.STATUS_CHOICES]
+        # Space each doctor's appointments evenly over the two years.
+        per_doctor = -(-rows // len(doctor_ids))
+        step_minutes = max(1, (730 * 24 * 60) // per_doctor)
+        self.stdout.write(f"Seeding {rows} appointments...")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Appointment._meta.db_table}
+                    (doctor_id, patient_id, appointment_date, status, created_at, updated_at)
+                SELECT (%s::bigint[])[1 + (n %% %s)], %s,
+                       %s::timestamptz + (n / %s) * %s * interval '1 minute',
+                       (%s::text[])[1 + ((n / %s) %% %s)], now(), now()
+                FROM generate_series(0, %s - 1) AS n
+                """,
+                [doctor_ids, len(doctor_ids), patient.id, start, len(doctor_ids), step_minutes,
+                 statuses, len(doctor_ids), len(statuses), rows],
+            )
+            cursor.execute(f"ANALYZE {Appointment._meta.db_table}")
+        day = (start + timedelta(days=365)).date()
+        return doctor_ids[0], day
@@ -0,0 +1,50 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from appointments.export import FORMATS, export_rows, stream_export
+from appointments.params import parse_bound as api_parse_bound
+
+
+def parse_bound(value, name, end=False):
+    # Same rules as the API filters: a bare date covers the whole day.
+    try:
+        return api_parse_bound(value, name, end=end)
+    except ValidationError:
+        raise CommandError(f"Invalid {name} '{value}'. Use ISO format.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream appointments, archived ones included, joined with their payments to a CSV or JSON Lines file "
+        "through a server-side cursor, optionally gzip compressed. Memory use does not "
+        "grow with the number of rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-',
+                            help="File to write; '-' for stdout. A .gz suffix turns on compression.")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the output suffix, else csv.')
+        parser.add_argument('--gzip', action='store_true', help='Compress even without a .gz suffix.')
+        parser.add_argument('--from', dest='date_from', help='First appointment date (inclusive).')
+        parser.add_argument('--to', dest='date_to', help='Last appointment date (inclusive for dates).')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        name = output[:-3] if output.endswith('.gz') else output
+        fmt = options['format'] or ('jsonl' if name.endswith('.jsonl') else 'csv')
+        compress = options['gzip'] or output.endswith('.gz')
+        date_from = parse_bound(options['date_from'], '--from') if options['date_from'] else None
+        date_to = parse_bound(options['date_to'], '--to', end=True) if options['date_to'] else None
+
+        chunks = stream_export(export_rows(date_from, date_to), fmt, compress)
+        written = 0
+        target = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for chunk in chunks:
+                target.write(chunk)
+                written += len(chunk)
+        finally:
+            if output != '-':
+                target.close()
+        if output != '-':
+            self.stderr.write(f"Wrote {written} bytes to {output}.")
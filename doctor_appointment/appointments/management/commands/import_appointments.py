@@ -0,0 +1,36 @@
+import gzip
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from appointments.importer import AppointmentImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import appointments from a CSV (header: doctor,patient,appointment_date[,status]) "
+        "or JSON Lines file, validating and inserting them in batches. Invalid rows are "
+        "reported and skipped; the rest of the file is still imported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file; a .gz suffix is decompressed on the fly.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Defaults to the file suffix, else csv.')
+        parser.add_argument('--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row without saving.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        name = path[:-3] if path.endswith('.gz') else path
+        fmt = options['format'] or ('jsonl' if name.endswith('.jsonl') else 'csv')
+        opener = gzip.open if path.endswith('.gz') else open
+        importer = AppointmentImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        try:
+            with opener(path, 'rt', encoding='utf-8-sig', newline='') as stream:
+                result = importer.run(read_rows(stream, fmt))
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Could not read {path}: {exc}")
+        for error in result['errors']:
+            self.stderr.write(f"row {error['row']}: {' '.join(error['errors'])}")
+        verb = "would be imported" if options['dry_run'] else "imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['created']} appointments {verb}, {len(result['errors'])} rows rejected."
+        ))
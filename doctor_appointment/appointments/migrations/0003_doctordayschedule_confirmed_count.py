@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_doctordayschedule_unique_active_doctor_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctordayschedule',
+            name='confirmed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
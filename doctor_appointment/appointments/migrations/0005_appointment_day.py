@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+import django.db.models.functions.datetime
+import zoneinfo
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_appt_patient_date_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='appointment_day',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.datetime.TruncDate('appointment_date', tzinfo=zoneinfo.ZoneInfo('UTC')), output_field=models.DateField()),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_day', 'status'], name='appt_doctor_day_status_idx'),
+        ),
+    ]
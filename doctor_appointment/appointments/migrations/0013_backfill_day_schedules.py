@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.utils import timezone
+
+ACTIVE_STATUSES = ('PENDING', 'CONFIRMED', 'RESCHEDULED')
+BATCH_SIZE = 2000
+
+
+def backfill_day_schedules(apps, schema_editor):
+    """
+    Fill the availability index from appointments booked before it existed: the
+    booked slots and confirmed count of every doctor-day from today on, as
+    availability.rebuild_day computes them. Past days are never read again.
+    """
+    Appointment = apps.get_model('appointments', 'Appointment')
+    DoctorDaySchedule = apps.get_model('appointments', 'DoctorDaySchedule')
+    start = timezone.make_aware(timezone.datetime.combine(timezone.localdate(), timezone.datetime.min.time()))
+    days = {}
+    rows = Appointment.objects.filter(
+        appointment_date__gte=start, status__in=ACTIVE_STATUSES
+    ).values_list('doctor_id', 'appointment_date', 'status').iterator(chunk_size=BATCH_SIZE)
+    for doctor_id, appointment_date, status in rows:
+        local = timezone.localtime(appointment_date)
+        slots, confirmed = days.get((doctor_id, local.date()), (set(), 0))
+        slots.add(local.strftime('%H:%M'))
+        days[(doctor_id, local.date())] = (slots, confirmed + (status == 'CONFIRMED'))
+    schedules = [
+        DoctorDaySchedule(doctor_id=doctor_id, date=day, booked_slots=sorted(slots), confirmed_count=confirmed)
+        for (doctor_id, day), (slots, confirmed) in days.items()
+    ]
+    DoctorDaySchedule.objects.bulk_create(
+        schedules,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['doctor', 'date'],
+        update_fields=['booked_slots', 'confirmed_count', 'updated_at'],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0012_appointment_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_day_schedules, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,19 @@
 from django.conf import settings
 from django.db import models
+from django.db.models.functions import TruncDate
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+import secrets
 from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+
+class AppointmentQuerySet(models.QuerySet):
+    def on_day(self, day):
+        # Filter on the stored appointment_day bucket rather than appointment_date__date,
+        # whose cast cannot use an index.
+        return self.filter(appointment_day=day)
+
 
 class Appointment(models.Model):
     STATUS_CHOICES = [
@@ -11,6 +22,16 @@ class Appointment(models.Model):
         ('CANCELED', 'Canceled'),
         ('RESCHEDULED', 'Rescheduled'),
     ]
+    # Statuses that occupy the doctor's time slot.
+    ACTIVE_STATUSES = ('PENDING', 'CONFIRMED', 'RESCHEDULED')
+    # Allowed status changes; a canceled appointment is final.
+    TRANSITIONS = {
+        'PENDING': ('CONFIRMED', 'RESCHEDULED', 'CANCELED'),
+        'CONFIRMED': ('RESCHEDULED', 'CANCELED'),
+        'RESCHEDULED': ('CONFIRMED', 'RESCHEDULED', 'CANCELED'),
+        'CANCELED': (),
+    }
+
     doctor = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
         on_delete=models.CASCADE, 
@@ -25,11 +46,47 @@ class Appointment(models.Model):
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped by every state transition; updates are conditional on the version that was read.
+    # db_default covers raw SQL inserts such as the benchmark seeders.
+    version = models.PositiveIntegerField(default=1, db_default=1)
+    # Calendar day of appointment_date in the project time zone, computed and stored by the database.
+    appointment_day = models.GeneratedField(
+        expression=TruncDate('appointment_date', tzinfo=ZoneInfo(settings.TIME_ZONE)),
+        output_field=models.DateField(),
+        db_persist=True,
+    )
+
+    objects = AppointmentQuerySet.as_manager()
     
     class Meta:
-        unique_together = ('doctor', 'appointment_date')
+        # Canceled appointments release their slot so it can be booked again.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date'],
+                condition=~models.Q(status='CANCELED'),
+                name='unique_active_doctor_slot',
+            ),
+        ]
         indexes = [
             models.Index(fields=['doctor', 'appointment_date']),
+            # Serves the patient appointment list, keyset-paginated on (appointment_date, id).
+            models.Index(fields=['patient', 'appointment_date', 'id'], name='appt_patient_date_id_idx'),
+            # Per-day lookups: daily rebuilds, bulk cancel by date, capacity checks.
+            models.Index(fields=['doctor', 'appointment_day', 'status'], name='appt_doctor_day_status_idx'),
+            # Reminder and capacity scans over live bookings; canceled/pending rows stay out of it.
+            models.Index(
+                fields=['appointment_date', 'doctor'],
+                condition=models.Q(status__in=['CONFIRMED', 'RESCHEDULED']),
+                name='appt_live_date_idx',
+            ),
+            # Stale-hold sweeper: oldest PENDING appointments first.
+            models.Index(
+                fields=['status', 'created_at'],
+                condition=models.Q(status='PENDING'),
+                name='appt_pending_created_idx',
+            ),
+            # Archiver: oldest appointments first, whatever their status.
+            models.Index(fields=['appointment_date', 'id'], name='appt_date_id_idx'),
         ]
     
     def clean(self):
@@ -40,16 +97,24 @@ class Appointment(models.Model):
         if self.appointment_date < now:
             raise ValidationError("Appointment date must be in the future.")
         
-        # Enforce doctor's limit: maximum 30 confirmed appointments per day.
+        # Enforce doctor's limit: DoctorProfile.max_appointments confirmed appointments per day.
+        # The count comes from the DoctorDaySchedule counter row rather than a COUNT query.
         if self.status == 'CONFIRMED':
-            confirmed_count = Appointment.objects.filter(
-                doctor=self.doctor, 
-                status='CONFIRMED', 
-                appointment_date__date=self.appointment_date.date()
-            ).exclude(id=self.id).count()
-            if confirmed_count >= 30:
+            from accounts.capacity import max_appointments
+            from .availability import confirmed_count as day_confirmed_count, slot_key
+            day = slot_key(self.appointment_date)[0]
+            confirmed_count = day_confirmed_count(self.doctor_id, day)
+            if not self._state.adding:
+                # Don't count this appointment against itself if it is already confirmed that day.
+                stored = Appointment.objects.filter(pk=self.pk).values_list('status', 'appointment_date').first()
+                if stored and stored[0] == 'CONFIRMED' and slot_key(stored[1])[0] == day:
+                    confirmed_count -= 1
+            if confirmed_count >= max_appointments(self.doctor_id):
                 raise ValidationError("Doctor has reached the maximum number of appointments for this day.")
     
+    def can_transition(self, status):
+        return status in self.TRANSITIONS.get(self.status, ())
+
     def can_cancel(self):
         # Allow cancellation only if more than 3 days remain until the appointment.
         return self.appointment_date - timezone.now() > timedelta(days=3)
@@ -75,6 +140,149 @@ class Waitlist(models.Model):
     
     class Meta:
         unique_together = ('doctor', 'patient', 'desired_date')
+        indexes = [
+            # Oldest-first lookup of the waitlist for a doctor and day.
+            models.Index(fields=['doctor', 'desired_date', 'created_at'], name='waitlist_doctor_date_idx'),
+        ]
     
     def __str__(self):
         return f"Waitlist Entry - Doctor: {self.doctor} Patient: {self.patient} on {self.desired_date}"
+
+
+class DoctorDaySchedule(models.Model):
+    """
+    Availability index and daily capacity counter: one row per doctor and day listing
+    the booked slot times and the number of confirmed appointments, kept in step with
+    every booking, cancellation and reschedule.
+    """
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="day_schedules"
+    )
+    date = models.DateField()
+    booked_slots = models.JSONField(default=list)  # Sorted "HH:MM" times of active appointments
+    confirmed_count = models.PositiveIntegerField(default=0)  # CONFIRMED appointments on this day
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('doctor', 'date')
+
+    def __str__(self):
+        return f"Schedule - Doctor: {self.doctor} on {self.date}"
+
+
+class WaitlistOffer(models.Model):
+    """
+    A freed slot offered to the head of a doctor-day waitlist. The slot is held by a
+    PENDING appointment for the patient until the offer is accepted or expires.
+    """
+    STATUS_CHOICES = [
+        ('OFFERED', 'Offered'),
+        ('ACCEPTED', 'Accepted'),
+        ('EXPIRED', 'Expired'),
+    ]
+    appointment = models.OneToOneField(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name="waitlist_offer"
+    )
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='OFFERED')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Waitlist Offer {self.id} - {self.appointment} ({self.status})"
+
+
+
+class ArchivedAppointment(models.Model):
+    """
+    Appointments moved out of the hot table by `manage.py archive_appointments`
+    once they are APPOINTMENT_ARCHIVE_AFTER_DAYS in the past. Rows keep their
+    original id, so payments and external references still resolve.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="archived_doctor_appointments"
+    )
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="archived_patient_appointments"
+    )
+    appointment_date = models.DateTimeField()
+    status = models.CharField(max_length=15, choices=Appointment.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'appointment_date', 'id'], name='archive_doctor_date_id_idx'),
+            models.Index(fields=['patient', 'appointment_date', 'id'], name='archive_patient_date_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived Appointment {self.id} - Doctor: {self.doctor} Patient: {self.patient}"
+
+
+class DoctorDayStats(models.Model):
+    """
+    Per-doctor, per-day utilization rollup for dashboards, refreshed incrementally
+    by appointments.rollup.refresh from rows whose updated_at moved since the last run.
+    """
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="day_stats"
+    )
+    date = models.DateField()
+    booked = models.PositiveIntegerField(default=0)  # Appointments holding a slot (not canceled)
+    pending = models.PositiveIntegerField(default=0)
+    confirmed = models.PositiveIntegerField(default=0)
+    rescheduled = models.PositiveIntegerField(default=0)
+    canceled = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # COMPLETED payments
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('doctor', 'date')
+        indexes = [
+            # Dashboards read a date range across all doctors.
+            models.Index(fields=['date', 'doctor'], name='stats_date_doctor_idx'),
+        ]
+
+    def __str__(self):
+        return f"Stats - Doctor: {self.doctor} on {self.date}"
+
+
+class RollupWatermark(models.Model):
+    """High-water mark of updated_at already folded into a rollup table."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+def new_feed_token():
+    return secrets.token_urlsafe(32)
+
+
+class CalendarFeed(models.Model):
+    """
+    Secret token for a user's iCalendar subscription URL. Calendar apps cannot send
+    JWT headers, so the token in the URL is the credential; rotating it revokes the old URL.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="calendar_feed"
+    )
+    token = models.CharField(max_length=64, unique=True, default=new_feed_token)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Calendar Feed of {self.user}"
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AppointmentCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (appointment_date, id). Each page is an index range scan
+    from the cursor position, so cost does not grow with how deep the client pages,
+    and cursors stay stable while new appointments are inserted.
+    """
+    ordering = ('appointment_date', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
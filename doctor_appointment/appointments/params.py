@@ -0,0 +1,34 @@
+from datetime import timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_bound(value, name, end=False):
+    # A bare date covers the whole day: date_from starts at midnight, date_to ends at the next midnight.
+    try:
+        day = parse_date(value)
+        parsed = parse_datetime(value) if day is None else timezone.datetime.combine(
+            day + timedelta(days=1) if end else day, timezone.datetime.min.time()
+        )
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: "Invalid date format. Use ISO format."})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_day(params, name, default):
+    # Date-only query params: absent means the default, anything unparseable is a 400.
+    value = params.get(name)
+    if not value:
+        return default
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValidationError({name: "Invalid date format. Use YYYY-MM-DD."})
+    return day
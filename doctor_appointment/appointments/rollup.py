@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from payments.models import Payment
+from .archive import archive_cutoff
+from .models import Appointment, DoctorDayStats, DoctorDaySchedule, RollupWatermark
+
+WATERMARK = 'doctor_day_stats'
+COUNTED_STATUSES = ('PENDING', 'CONFIRMED', 'RESCHEDULED', 'CANCELED')
+STAT_FIELDS = ('booked', 'pending', 'confirmed', 'rescheduled', 'canceled', 'revenue')
+
+
+def dirty_days(since, until):
+    """
+    (doctor_id, day) pairs touched in [since, until). Schedule rows are saved on every
+    booking, cancellation and move, so they also flag the day an appointment left;
+    payments flag the day of their appointment.
+    """
+    window = {'updated_at__gte': since, 'updated_at__lt': until}
+    pairs = set(DoctorDaySchedule.objects.filter(**window).values_list('doctor_id', 'date'))
+    pairs.update(Appointment.objects.filter(**window).values_list('doctor_id', 'appointment_day'))
+    pairs.update(Payment.objects.filter(**window).values_list('appointment__doctor_id', 'appointment__appointment_day'))
+    # Days already moved to the archive keep the figures they had.
+    frozen = timezone.localdate(archive_cutoff())
+    return sorted((doctor_id, day) for doctor_id, day in pairs if doctor_id and day and day >= frozen)
+
+
+def recompute(pairs):
+    """Rebuild the stats rows for the given doctor-days with one grouped query and one upsert."""
+    doctor_ids = {doctor_id for doctor_id, _ in pairs}
+    days = {day for _, day in pairs}
+    rows = Appointment.objects.filter(doctor_id__in=doctor_ids, appointment_day__in=days).values(
+        'doctor_id', 'appointment_day'
+    ).annotate(
+        # The payments join repeats an appointment once per payment, hence distinct counts.
+        **{status.lower(): Count('id', distinct=True, filter=Q(status=status)) for status in COUNTED_STATUSES},
+        revenue=Sum('payments__amount', filter=Q(payments__status='COMPLETED')),
+    ).order_by()
+    stats = {(pair[0], pair[1]): DoctorDayStats(doctor_id=pair[0], date=pair[1]) for pair in pairs}
+    for row in rows:
+        stat = stats.get((row['doctor_id'], row['appointment_day']))
+        if stat is None:
+            continue
+        stat.pending, stat.confirmed = row['pending'], row['confirmed']
+        stat.rescheduled, stat.canceled = row['rescheduled'], row['canceled']
+        stat.booked = stat.pending + stat.confirmed + stat.rescheduled
+        stat.revenue = row['revenue'] or Decimal('0')
+    stamp = timezone.now()
+    for stat in stats.values():
+        stat.refreshed_at = stamp
+    DoctorDayStats.objects.bulk_create(
+        stats.values(),
+        update_conflicts=True,
+        unique_fields=['doctor', 'date'],
+        update_fields=[*STAT_FIELDS, 'refreshed_at'],
+    )
+    return len(stats)
+
+
+def refresh(full=False):
+    """
+    Fold every change since the last watermark into DoctorDayStats. Only the touched
+    doctor-days are recomputed, ROLLUP_BATCH_SIZE at a time. The window stops
+    ROLLUP_LAG_SECONDS short of now so rows saved by still-open transactions are
+    picked up next run instead of being skipped. Returns the number of rows refreshed.
+    """
+    until = timezone.now() - timedelta(seconds=settings.ROLLUP_LAG_SECONDS)
+    with transaction.atomic():
+        RollupWatermark.objects.get_or_create(
+            name=WATERMARK, defaults={'value': datetime.min.replace(tzinfo=dt_timezone.utc)}
+        )
+        # The row lock keeps concurrent refreshes from interleaving.
+        watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK)
+        since = datetime.min.replace(tzinfo=dt_timezone.utc) if full else watermark.value
+        pairs = dirty_days(since, until)
+        refreshed = 0
+        for start in range(0, len(pairs), settings.ROLLUP_BATCH_SIZE):
+            refreshed += recompute(pairs[start:start + settings.ROLLUP_BATCH_SIZE])
+        watermark.value = until
+        watermark.save(update_fields=['value'])
+    return refreshed
@@ -1,13 +1,20 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
-from .models import Appointment, Waitlist
+from .availability import on_grid
+from .models import Appointment, ArchivedAppointment, Waitlist
+
+SLOT_GRID_ERROR = (
+    f"Appointments start on the {settings.APPOINTMENT_SLOT_MINUTES}-minute slot grid "
+    f"between {settings.APPOINTMENT_DAY_START} and {settings.APPOINTMENT_DAY_END}."
+)
 
 class AppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
-        fields = '__all__'
-        read_only_fields = ('status', 'created_at', 'updated_at')
+        exclude = ('appointment_day',)
+        read_only_fields = ('status', 'version', 'created_at', 'updated_at')
     
     def validate_appointment_date(self, value):
         now = timezone.now()
@@ -15,14 +22,88 @@ class AppointmentSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Appointment date must be in the future.")
         if value > now + timedelta(days=15):
             raise serializers.ValidationError("Appointment must be within 15 days from now.")
+        # Off-grid times would share a slot_key with the grid slot they truncate to.
+        if not on_grid(value):
+            raise serializers.ValidationError(SLOT_GRID_ERROR)
         return value
     
     def create(self, validated_data):
         # After a successful payment in your payment app, you would confirm the appointment.
         # Here, we set the appointment status to 'CONFIRMED' by default.
         validated_data['status'] = 'CONFIRMED'
-        appointment = Appointment.objects.create(**validated_data)
-        return appointment
+        from .services import BookingError, book_appointment
+        try:
+            return book_appointment(**validated_data)
+        except BookingError as exc:
+            raise serializers.ValidationError({"appointment_date": str(exc)})
+
+class AppointmentFieldSet:
+    """
+    Read-only rendering of appointments for ?fields= / ?expand= requests.
+
+    Rows come from queryset.values() with only the requested columns, and doctor /
+    patient are joined only when expanded; each row is turned into a dict directly
+    instead of going through per-field serializer machinery.
+    """
+    FIELDS = ('id', 'appointment_date', 'status', 'version', 'created_at', 'updated_at', 'doctor', 'patient')
+    EXPANDABLE = ('doctor', 'patient')
+    # Enough to show the other party by name; contact details stay out of the list.
+    USER_FIELDS = ('id', 'username', 'first_name', 'last_name')
+    DATETIME_FIELDS = ('appointment_date', 'created_at', 'updated_at')
+    # Columns the cursor paginator orders on; always selected even if not rendered.
+    ORDERING_FIELDS = ('id', 'appointment_date')
+
+    _datetime = serializers.DateTimeField()
+
+    def __init__(self, fields=None, expand=None):
+        fields = fields or self.FIELDS
+        expand = expand or ()
+        unknown = [f for f in fields if f not in self.FIELDS]
+        if unknown:
+            raise serializers.ValidationError({"fields": f"Unknown fields: {', '.join(unknown)}."})
+        unknown = [f for f in expand if f not in self.EXPANDABLE]
+        if unknown:
+            raise serializers.ValidationError({"expand": f"Cannot expand: {', '.join(unknown)}."})
+        self.fields = [f for f in self.FIELDS if f in fields]
+        self.expand = [f for f in expand if f in self.fields]
+
+    @classmethod
+    def from_request(cls, request):
+        def split(name):
+            value = request.query_params.get(name)
+            return [part.strip() for part in value.split(',') if part.strip()] if value else None
+        return cls(split('fields'), split('expand'))
+
+    def columns(self):
+        columns = [f for f in self.ORDERING_FIELDS if f not in self.fields]
+        for field in self.fields:
+            if field in self.expand:
+                columns.extend(f'{field}__{name}' for name in self.USER_FIELDS)
+            elif field in self.EXPANDABLE:
+                columns.append(f'{field}_id')
+            else:
+                columns.append(field)
+        return columns
+
+    def to_representation(self, row):
+        data = {}
+        for field in self.fields:
+            if field in self.expand:
+                data[field] = {name: row[f'{field}__{name}'] for name in self.USER_FIELDS}
+            elif field in self.EXPANDABLE:
+                data[field] = row[f'{field}_id']
+            elif field in self.DATETIME_FIELDS:
+                data[field] = self._datetime.to_representation(row[field])
+            else:
+                data[field] = row[field]
+        return data
+
+
+class ArchivedAppointmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedAppointment
+        fields = ('id', 'doctor', 'patient', 'appointment_date', 'status', 'created_at', 'updated_at', 'archived_at')
+        read_only_fields = fields
 
 class WaitlistSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,222 @@
+from datetime import timezone as dt_timezone
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from accounts.capacity import adjust_current_appointments, max_appointments
+from payments.models import Payment
+from .models import Appointment, WaitlistOffer
+from .cache import bump_versions
+from .availability import (
+    free_slots_from, is_taken, lock_day, mark_moved, mark_released, rebuild_day, slot_key,
+)
+
+
+class BookingError(Exception):
+    pass
+
+
+class TransitionError(Exception):
+    """The status change is not allowed from the appointment's current status."""
+
+
+class ConflictError(Exception):
+    """The appointment was changed by another request since it was read."""
+
+
+def book_appointment(**fields):
+    """
+    Create an appointment while holding the lock on the doctor's day row, so the
+    daily cap and slot check cannot race with another booking for the same doctor
+    and day. Bookings for other doctors or days never wait on each other.
+    """
+    doctor = fields.get('doctor')
+    doctor_id = fields.get('doctor_id') or doctor.id
+    day, slot = slot_key(fields['appointment_date'])
+    status = fields.get('status', 'PENDING')
+    with transaction.atomic():
+        schedule = lock_day(doctor_id, day)
+        if slot in schedule.booked_slots:
+            raise BookingError("This time slot is already booked.")
+        if status == 'CONFIRMED' and schedule.confirmed_count >= max_appointments(doctor_id):
+            raise BookingError("Doctor has reached the maximum number of appointments for this day.")
+        try:
+            with transaction.atomic():
+                appointment = Appointment.objects.create(**fields)
+        except IntegrityError:
+            raise BookingError("This time slot is already booked.")
+        schedule.booked_slots = sorted(schedule.booked_slots + [slot])
+        if status == 'CONFIRMED':
+            schedule.confirmed_count += 1
+        schedule.save(update_fields=['booked_slots', 'confirmed_count', 'updated_at'])
+        adjust_current_appointments(doctor_id, 1)
+    return appointment
+
+
+def check_transition(appointment, status):
+    if appointment.status == status and not appointment.can_transition(status):
+        raise TransitionError(f"This appointment is already {status.lower()}.")
+    if not appointment.can_transition(status):
+        raise TransitionError(
+            f"A {appointment.status.lower()} appointment cannot be changed to {status.lower()}."
+        )
+
+
+def transition(appointment, status, expected_version=None, **changes):
+    """
+    Move the appointment to `status` with a single conditional
+    UPDATE ... WHERE id = %s AND version = %s that writes only the status, the given
+    fields, version and updated_at. expected_version defaults to the version the
+    instance was read with; pass the client's to detect edits made in between.
+    Raises TransitionError for moves the state machine forbids and ConflictError
+    when the row no longer has the expected version.
+    """
+    check_transition(appointment, status)
+    version = appointment.version if expected_version is None else expected_version
+    now = timezone.now()
+    updated = Appointment.objects.filter(pk=appointment.pk, version=version).update(
+        status=status, version=F('version') + 1, updated_at=now, **changes
+    )
+    if not updated:
+        raise ConflictError("This appointment was changed by someone else. Reload it and try again.")
+    for field, value in changes.items():
+        setattr(appointment, field, value)
+    appointment.status, appointment.version, appointment.updated_at = status, version + 1, now
+    # update() skips post_save, so invalidate cached responses here.
+    bump_versions([appointment.doctor_id, appointment.patient_id])
+    return appointment
+
+
+def cancel_appointment(appointment, expected_version=None):
+    old_status = appointment.status
+    with transaction.atomic():
+        # Day lock before the row, the same order as booking and rescheduling.
+        lock_day(appointment.doctor_id, slot_key(appointment.appointment_date)[0])
+        transition(appointment, 'CANCELED', expected_version)
+        mark_released(appointment.doctor_id, appointment.appointment_date, old_status)
+        adjust_current_appointments(appointment.doctor_id, -1)
+    return appointment
+
+
+def reschedule_appointment(appointment, new_date, expected_version=None):
+    """
+    Move the appointment to new_date, checking the slot under the day locks.
+    Raises BookingError (leaving the instance unchanged) if the slot is taken.
+    """
+    check_transition(appointment, 'RESCHEDULED')
+    old_date, old_status = appointment.appointment_date, appointment.status
+    old_key, new_key = slot_key(old_date), slot_key(new_date)
+    with transaction.atomic():
+        # Lock both days in date order so concurrent moves cannot deadlock.
+        for day in sorted({old_key[0], new_key[0]}):
+            schedule = lock_day(appointment.doctor_id, day)
+            if day == new_key[0]:
+                new_schedule = schedule
+        if new_key != old_key and is_taken(new_schedule.booked_slots, new_key[1]):
+            raise BookingError("This time slot is already booked.")
+        try:
+            with transaction.atomic():
+                transition(appointment, 'RESCHEDULED', expected_version, appointment_date=new_date)
+        except IntegrityError:
+            raise BookingError("This time slot is already booked.")
+        mark_moved(appointment.doctor_id, old_date, old_status, new_date, appointment.status)
+    return appointment
+
+
+def reschedule_to_nearest(appointment, start, until, expected_version=None):
+    """
+    Move the appointment to the doctor's first free slot at or after `start`.
+    Candidates come from the availability index; a slot claimed by someone else
+    since it was read is skipped and the next one tried.
+    """
+    for candidate in free_slots_from(appointment.doctor_id, start, until):
+        try:
+            return reschedule_appointment(appointment, candidate, expected_version)
+        except BookingError:
+            continue
+    raise BookingError("No free slot is available in the booking window.")
+
+
+def bulk_cancel(queryset):
+    """
+    Cancel every not-yet-canceled appointment in the queryset with a single
+    UPDATE ... RETURNING and refresh the counters of the affected doctor-days.
+    The doctor-days are locked before the UPDATE takes its row locks, the same
+    order as booking, cancelling and rescheduling, so a racing single cancel
+    cannot deadlock with it. Returns the ids of the appointments that were canceled.
+    """
+    table = Appointment._meta.db_table
+    with transaction.atomic():
+        candidates = list(queryset.exclude(status='CANCELED').values_list('id', 'doctor_id', 'appointment_date'))
+        if not candidates:
+            return []
+        for doctor_id, day in sorted({(doctor_id, slot_key(date)[0]) for _, doctor_id, date in candidates}):
+            lock_day(doctor_id, day)
+        # Only the rows whose days are locked; anything booked since is left alone.
+        subquery, params = queryset.filter(id__in=[row[0] for row in candidates]).values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET status = %s, updated_at = %s, version = version + 1 "
+                f"WHERE id IN ({subquery}) AND status <> %s "
+                f"RETURNING id, doctor_id, patient_id, appointment_date",
+                ['CANCELED', timezone.now(), *params, 'CANCELED'],
+            )
+            rows = cursor.fetchall()
+        # Every row was in an active status before the update, so each one frees a slot.
+        released = {}
+        days = set()
+        for _, doctor_id, _, appointment_date in rows:
+            released[doctor_id] = released.get(doctor_id, 0) + 1
+            # Raw cursors return naive UTC datetimes on backends without timezone support.
+            if timezone.is_naive(appointment_date):
+                appointment_date = timezone.make_aware(appointment_date, dt_timezone.utc)
+            days.add((doctor_id, slot_key(appointment_date)[0]))
+        for doctor_id, day in sorted(days):
+            rebuild_day(doctor_id, day)
+        for doctor_id, n in released.items():
+            adjust_current_appointments(doctor_id, -n)
+        # The raw UPDATE bypasses post_save, so invalidate cached responses here.
+        bump_versions({row[1] for row in rows} | {row[2] for row in rows})
+    return [row[0] for row in rows]
+
+
+def expire_stale_pending(cutoff, payment_cutoff, batch_size):
+    """
+    Cancel up to batch_size abandoned holds created before cutoff. A hold is a
+    PENDING appointment that went to checkout (it has a payment) or whose waitlist
+    offer expired; other PENDING rows, such as imports awaiting confirmation, are
+    never touched. Holds with a COMPLETED payment, a payment still awaiting approval
+    since payment_cutoff, or a live offer are kept. Candidates are read oldest first
+    from the pending (status, created_at) index without row locks; bulk_cancel then
+    locks their doctor-days before the UPDATE re-applies the same conditions, so a
+    hold confirmed or paid in between is left alone and the sweep takes its locks in
+    the same order as every other writer. Returns [(id, doctor_id, appointment_date), ...]
+    of the appointments released.
+    """
+    payments = Payment.objects.filter(appointment=OuterRef('pk'))
+    offers = WaitlistOffer.objects.filter(appointment=OuterRef('pk'))
+    holds = (
+        Appointment.objects.filter(status='PENDING', created_at__lt=cutoff)
+        .filter(Q(Exists(payments)) | Q(Exists(offers.filter(status='EXPIRED'))))
+        .exclude(Exists(offers.filter(status='OFFERED')))
+        .exclude(Exists(payments.filter(
+            Q(status='COMPLETED') | Q(status__in=('CREATED', 'PENDING'), created_at__gte=payment_cutoff)
+        )))
+    )
+    stale = list(holds.order_by('created_at').values_list('id', 'doctor_id', 'appointment_date')[:batch_size])
+    if not stale:
+        return []
+    canceled = set(bulk_cancel(holds.filter(id__in=[row[0] for row in stale])))
+    return [row for row in stale if row[0] in canceled]
+
+
+def confirm_appointment(appointment):
+    """Confirm a held appointment, enforcing the daily cap under the doctor-day lock."""
+    day = slot_key(appointment.appointment_date)[0]
+    with transaction.atomic():
+        schedule = lock_day(appointment.doctor_id, day)
+        if schedule.confirmed_count >= max_appointments(appointment.doctor_id):
+            raise BookingError("Doctor has reached the maximum number of appointments for this day.")
+        transition(appointment, 'CONFIRMED')
+        schedule.confirmed_count += 1
+        schedule.save(update_fields=['confirmed_count', 'updated_at'])
+    return appointment
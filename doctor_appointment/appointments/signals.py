@@ -0,0 +1,8 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Appointment
+from .cache import bump_versions
+
+@receiver([post_save, post_delete], sender=Appointment)
+def invalidate_appointment_cache(sender, instance, **kwargs):
+    bump_versions([instance.doctor_id, instance.patient_id])
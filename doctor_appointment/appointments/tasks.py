@@ -1,30 +1,51 @@
+from datetime import timedelta
 from celery import shared_task
-from django.core.mail import send_mail
+from django.db import transaction
+from django.utils import timezone
+from django.core.mail import EmailMessage, get_connection, send_mail
 from django.conf import settings
-from .models import Appointment, Waitlist
+from .models import Appointment, Waitlist, WaitlistOffer
 from django.utils.dateparse import parse_datetime
 
-@shared_task
-def notify_availability(doctor_id, appointment_date_iso):
-    appointment_date = parse_datetime(appointment_date_iso)
-    # Query waitlist for patients interested in the specific date.
-    waitlist_entries = Waitlist.objects.filter(
-        doctor_id=doctor_id, 
+def availability_messages(doctor_id, appointment_date):
+    # One query for the whole waitlist: only the two patient columns the email needs.
+    recipients = Waitlist.objects.filter(
+        doctor_id=doctor_id,
         desired_date=appointment_date.date()
-    )
-    for entry in waitlist_entries:
-        send_mail(
+    ).order_by('created_at').values_list('patient__username', 'patient__email')
+    return [
+        EmailMessage(
             'Appointment Slot Available',
-            f'Dear {entry.patient.username},\n\nA slot has opened up on {appointment_date} with your desired doctor. Please log in to book your appointment.',
+            f'Dear {username},\n\nA slot has opened up on {appointment_date} with your desired doctor. Please log in to book your appointment.',
             settings.DEFAULT_FROM_EMAIL,
-            [entry.patient.email],
-            fail_silently=False,
+            [email],
         )
+        for username, email in recipients.iterator(chunk_size=settings.NOTIFICATION_BATCH_SIZE)
+    ]
+
+def send_in_batches(messages, batch_size=None, connection=None):
+    # Deliver over a single SMTP session, handing the backend batch_size messages at a time.
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    sent = 0
+    with connection or get_connection(fail_silently=False) as connection:
+        for start in range(0, len(messages), batch_size):
+            sent += connection.send_messages(messages[start:start + batch_size]) or 0
+    return sent
+
+@shared_task
+def notify_availability(doctor_id, appointment_date_iso):
+    appointment_date = parse_datetime(appointment_date_iso)
+    # Email every patient waitlisted for the date, over one SMTP connection.
+    return send_in_batches(availability_messages(doctor_id, appointment_date))
 
 @shared_task
 def notify_reschedule(appointment_id):
+    # Notifications are coalesced in the outbox; always describe the appointment's
+    # latest state and stay silent if it has since moved on (e.g. been canceled).
     try:
-        appointment = Appointment.objects.get(id=appointment_id)
+        appointment = Appointment.objects.select_related('doctor', 'patient').get(id=appointment_id)
+        if appointment.status != 'RESCHEDULED':
+            return
         send_mail(
             'Appointment Rescheduled',
             f'Your appointment with Dr. {appointment.doctor} has been rescheduled to {appointment.appointment_date}.',
@@ -35,16 +56,88 @@ def notify_reschedule(appointment_id):
     except Appointment.DoesNotExist:
         pass
 
+def doctor_cancellation_message(appointment):
+    return EmailMessage(
+        'Appointment Canceled by Doctor',
+        f'Your appointment with Dr. {appointment.doctor} on {appointment.appointment_date} has been canceled by the doctor.',
+        settings.DEFAULT_FROM_EMAIL,
+        [appointment.patient.email],
+    )
+
 @shared_task
 def notify_doctor_cancellation(appointment_id):
     try:
-        appointment = Appointment.objects.get(id=appointment_id)
+        appointment = Appointment.objects.select_related('doctor', 'patient').get(id=appointment_id)
+        if appointment.status != 'CANCELED':
+            return
+        doctor_cancellation_message(appointment).send(fail_silently=False)
+    except Appointment.DoesNotExist:
+        pass
+
+@shared_task
+def notify_bulk_doctor_cancellation(appointment_ids):
+    # Load appointments with their doctor and patient in batches and send every
+    # message over a single SMTP connection.
+    batch_size = settings.NOTIFICATION_BATCH_SIZE
+    with get_connection(fail_silently=False) as connection:
+        for start in range(0, len(appointment_ids), batch_size):
+            batch = Appointment.objects.filter(
+                id__in=appointment_ids[start:start + batch_size], status='CANCELED'
+            ).select_related('doctor', 'patient')
+            connection.send_messages([doctor_cancellation_message(appointment) for appointment in batch])
+
+@shared_task
+def offer_freed_slot(doctor_id, appointment_date_iso):
+    from .waitlist import offer_slot
+    offer_slot(doctor_id, parse_datetime(appointment_date_iso))
+
+@shared_task
+def send_waitlist_offer(offer_id):
+    try:
+        offer = WaitlistOffer.objects.select_related('appointment__doctor', 'appointment__patient').get(id=offer_id)
+        appointment = offer.appointment
         send_mail(
-            'Appointment Canceled by Doctor',
-            f'Your appointment with Dr. {appointment.doctor} on {appointment.appointment_date} has been canceled by the doctor.',
+            'Appointment Slot Reserved For You',
+            f'Dear {appointment.patient.username},\n\nA slot on {appointment.appointment_date} with Dr. {appointment.doctor} '
+            f'is being held for you until {offer.expires_at}. Please log in and accept the offer before then to confirm it.',
             settings.DEFAULT_FROM_EMAIL,
             [appointment.patient.email],
             fail_silently=False,
         )
-    except Appointment.DoesNotExist:
+    except WaitlistOffer.DoesNotExist:
         pass
+
+@shared_task
+def expire_waitlist_offer(offer_id):
+    from .waitlist import expire_offer
+    expire_offer(offer_id)
+
+@shared_task
+def expire_stale_appointments():
+    """
+    Beat sweeper: cancel abandoned holds (PENDING appointments with an unpaid
+    payment or an expired waitlist offer) older than PENDING_APPOINTMENT_TTL_MINUTES
+    in bounded batches and pass each freed future slot to the waitlist. Each batch
+    is its own short transaction.
+    """
+    from .services import expire_stale_pending
+    from .waitlist import enqueue_freed_slot
+    now = timezone.now()
+    cutoff = now - timedelta(minutes=settings.PENDING_APPOINTMENT_TTL_MINUTES)
+    payment_cutoff = now - timedelta(minutes=settings.PENDING_PAYMENT_TTL_MINUTES)
+    total = 0
+    for _ in range(settings.SWEEP_MAX_BATCHES):
+        with transaction.atomic():
+            released = expire_stale_pending(cutoff, payment_cutoff, settings.SWEEP_BATCH_SIZE)
+            for _, doctor_id, appointment_date in released:
+                if appointment_date > now:
+                    enqueue_freed_slot(doctor_id, appointment_date)
+        total += len(released)
+        if len(released) < settings.SWEEP_BATCH_SIZE:
+            break
+    return total
+
+@shared_task
+def refresh_doctor_stats():
+    from .rollup import refresh
+    return refresh()
@@ -1,3 +1,1050 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
+from urllib.parse import urlparse
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts import capacity
+from accounts.models import CustomUser, DoctorProfile
+from notifications.models import OutboxMessage
+from payments.models import Payment
+from . import archive, cache as response_cache, ics, idempotency, rollup
+from .models import (
+    Appointment, ArchivedAppointment, DoctorDaySchedule, DoctorDayStats, RollupWatermark, Waitlist, WaitlistOffer,
+)
+from .availability import lock_day, rebuild_day
+from .importer import AppointmentImporter
+from .pagination import AppointmentCursorPagination
+from .serializers import SLOT_GRID_ERROR
+from . import services
+from .services import BookingError, ConflictError, book_appointment, bulk_cancel, cancel_appointment
+from .tasks import expire_stale_appointments, offer_freed_slot
+from .waitlist import expire_offer
 
-# Create your tests here.
+
+def make_doctor(username='doc', max_appointments=30):
+    # The profile signal cannot fill DoctorProfile's required fields, so it is created here.
+    doctor = CustomUser.objects.create_user(username, f'{username}@example.com', 'pw')
+    CustomUser.objects.filter(pk=doctor.pk).update(role='doctor')
+    doctor.refresh_from_db()
+    DoctorProfile.objects.create(user=doctor, specialty='GP', experience_years=1, max_appointments=max_appointments)
+    return doctor
+
+
+def make_patient(username='pat'):
+    return CustomUser.objects.create_user(username, f'{username}@example.com', 'pw', role='patient')
+
+
+def slot(days=5, hour=9, minute=0):
+    return (timezone.now() + timedelta(days=days)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+class AppointmentTestCase(TestCase):
+    def setUp(self):
+        self.clear_caches()
+        capacity._max_appointments_cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def clear_caches(self):
+        # Shared cache and this process's LRU in front of it.
+        cache.clear()
+        response_cache._local._data.clear()
+
+    def book(self, when, client=None, **headers):
+        data = {'doctor': self.doctor.id, 'patient': self.patient.id, 'appointment_date': when.isoformat()}
+        return (client or self.client).post('/api/appointments/appointments/', data, format='json', **headers)
+
+
+class BookingTests(AppointmentTestCase):
+    def schedule(self, when):
+        return DoctorDaySchedule.objects.get(doctor=self.doctor, date=timezone.localdate(when))
+
+    def test_booking_updates_the_day_counters(self):
+        self.assertEqual(self.book(slot()).status_code, 201)
+        self.assertEqual(self.book(slot(hour=10)).status_code, 201)
+        schedule = self.schedule(slot())
+        self.assertEqual(schedule.booked_slots, ['09:00', '10:00'])
+        self.assertEqual(schedule.confirmed_count, 2)
+        self.assertEqual(DoctorProfile.objects.get(user=self.doctor).current_appointments, 2)
+
+    def test_taken_slot_is_rejected(self):
+        self.assertEqual(self.book(slot()).status_code, 201)
+        self.assertEqual(self.book(slot()).status_code, 400)
+        with self.assertRaises(BookingError):
+            book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id, appointment_date=slot())
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(self.schedule(slot()).confirmed_count, 1)
+
+    def test_daily_cap_is_enforced(self):
+        DoctorProfile.objects.filter(user=self.doctor).update(max_appointments=1)
+        self.assertEqual(self.book(slot()).status_code, 201)
+        self.assertEqual(self.book(slot(hour=10)).status_code, 400)
+        # The cap is per day; a held (PENDING) slot does not count towards it.
+        self.assertEqual(self.book(slot(days=6)).status_code, 201)
+        book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id,
+                         appointment_date=slot(hour=11), status='PENDING')
+        self.assertEqual(self.schedule(slot()).confirmed_count, 1)
+
+    def test_profile_save_refreshes_the_cached_cap(self):
+        profile = DoctorProfile.objects.get(user=self.doctor)
+        profile.max_appointments = 1
+        profile.save()
+        self.assertEqual(self.book(slot()).status_code, 201)
+        self.assertEqual(self.book(slot(hour=10)).status_code, 400)
+        profile.max_appointments = 2
+        profile.save()
+        self.assertEqual(self.book(slot(hour=10)).status_code, 201)
+
+
+class CounterBookkeepingTests(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.appointment_id = self.book(slot()).data['id']
+
+    def url(self, action):
+        return f'/api/appointments/appointments/{self.appointment_id}/{action}/'
+
+    def day(self, when):
+        schedule = DoctorDaySchedule.objects.get(doctor=self.doctor, date=timezone.localdate(when))
+        return schedule.booked_slots, schedule.confirmed_count
+
+    def assert_matches_rebuild(self, when):
+        counters = self.day(when)
+        rebuild_day(self.doctor.id, timezone.localdate(when))
+        self.assertEqual(self.day(when), counters)
+
+    def test_cancel_releases_the_slot(self):
+        self.assertEqual(self.client.post(self.url('cancel')).status_code, 200)
+        self.assertEqual(self.day(slot()), ([], 0))
+        self.assertEqual(DoctorProfile.objects.get(user=self.doctor).current_appointments, 0)
+        self.assertEqual(self.book(slot()).status_code, 201)
+        self.assert_matches_rebuild(slot())
+
+    def test_reschedule_moves_the_slot(self):
+        new_date = slot(days=6, hour=10)
+        response = self.client.post(self.url('reschedule'), {'appointment_date': new_date.isoformat()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.day(slot()), ([], 0))
+        # RESCHEDULED holds the slot but is not a confirmed appointment.
+        self.assertEqual(self.day(new_date), (['10:00'], 0))
+        self.assertEqual(DoctorProfile.objects.get(user=self.doctor).current_appointments, 1)
+        self.assert_matches_rebuild(slot())
+        self.assert_matches_rebuild(new_date)
+
+    def test_direct_edits_are_not_allowed(self):
+        url = f'/api/appointments/appointments/{self.appointment_id}/'
+        data = {'doctor': self.doctor.id, 'patient': self.patient.id, 'appointment_date': slot(hour=11).isoformat()}
+        self.assertEqual(self.client.patch(url, {'appointment_date': slot(hour=11).isoformat()}, format='json').status_code, 405)
+        self.assertEqual(self.client.put(url, data, format='json').status_code, 405)
+        self.assertEqual(self.client.delete(url).status_code, 405)
+        self.assertEqual(self.day(slot()), (['09:00'], 1))
+        self.assert_matches_rebuild(slot())
+
+    def test_reschedule_into_a_taken_slot_changes_nothing(self):
+        taken = slot(hour=10)
+        book_appointment(doctor_id=self.doctor.id, patient_id=make_patient('other').id,
+                         appointment_date=taken, status='CONFIRMED')
+        response = self.client.post(self.url('reschedule'), {'appointment_date': taken.isoformat()}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.day(slot()), (['09:00', '10:00'], 2))
+        self.assertEqual(Appointment.objects.get(pk=self.appointment_id).appointment_date, slot())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentBookingTests(TransactionTestCase):
+    """Bookings racing on one doctor-day; needs real row locks, so it only runs on PostgreSQL."""
+
+    def setUp(self):
+        capacity._max_appointments_cache.clear()
+        self.doctor = make_doctor(max_appointments=1)
+        self.patients = [make_patient(f'pat{i}') for i in range(4)]
+
+    def race(self, dates):
+        barrier = threading.Barrier(len(dates))
+        outcomes = []
+
+        def attempt(patient, when):
+            try:
+                barrier.wait()
+                book_appointment(doctor_id=self.doctor.id, patient_id=patient.id,
+                                 appointment_date=when, status='CONFIRMED')
+                outcomes.append('booked')
+            except BookingError:
+                outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=pair) for pair in zip(self.patients, dates)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(outcomes)
+
+    def test_one_winner_per_slot(self):
+        self.assertEqual(self.race([slot()] * 4), ['booked'] + ['rejected'] * 3)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_cap_holds_under_concurrent_bookings(self):
+        self.assertEqual(self.race([slot(hour=hour) for hour in (9, 10, 11, 12)]), ['booked'] + ['rejected'] * 3)
+        self.assertEqual(DoctorDaySchedule.objects.get(doctor=self.doctor).confirmed_count, 1)
+
+
+class CursorPaginationTests(AppointmentTestCase):
+    url = '/api/appointments/appointments/'
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [
+            book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id, appointment_date=slot(days=day)).id
+            for day in range(5, 10)
+        ]
+
+    def walk(self, **params):
+        response = self.client.get(self.url, params)
+        pages = [[row['id'] for row in response.data['results']]]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append([row['id'] for row in response.data['results']])
+        return pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        pages = self.walk(page_size=2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), self.ids)
+
+    def test_previous_cursor_walks_back(self):
+        first = self.client.get(self.url, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_rows_inserted_before_the_cursor_do_not_shift_later_pages(self):
+        first = self.client.get(self.url, {'page_size': 2})
+        book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id, appointment_date=slot(days=4))
+        second = self.client.get(first.data['next'])
+        self.assertEqual([row['id'] for row in second.data['results']], self.ids[2:4])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(AppointmentCursorPagination, 'max_page_size', 3):
+            response = self.client.get(self.url, {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_date_bounds(self):
+        day = timezone.localdate(slot(days=6)).isoformat()
+        response = self.client.get(self.url, {'date_from': day, 'date_to': day})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.ids[1]])
+        response = self.client.get(self.url, {'date_from': 'soon'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date_from', response.data)
+
+
+class ConditionalGetTests(AppointmentTestCase):
+    url = '/api/appointments/appointments/'
+
+    def setUp(self):
+        super().setUp()
+        self.appointment_id = self.book(slot()).data['id']
+
+    def test_list_revalidates_with_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Authorization', response['Vary'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # The validator is recomputed from the database when no cached body exists.
+        self.clear_caches()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_list_etag_changes_with_the_rows(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(slot(hour=10))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_etag_depends_on_the_query(self):
+        self.assertNotEqual(self.client.get(self.url)['ETag'], self.client.get(self.url, {'page_size': 1})['ETag'])
+
+    def test_non_numeric_id_is_not_found(self):
+        self.assertEqual(self.client.get(f'{self.url}abc/').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}999999/').status_code, 404)
+
+    def test_detail_revalidates_with_etag_and_last_modified(self):
+        url = f'{self.url}{self.appointment_id}/'
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.clear_caches()
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{url}cancel/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['status']), (200, 'CANCELED'))
+
+
+class ResponseCacheTests(AppointmentTestCase):
+    url = '/api/appointments/appointments/'
+
+    def setUp(self):
+        super().setUp()
+        self.appointment_id = self.book(slot()).data['id']
+        self.doctor_client = APIClient()
+        self.doctor_client.force_authenticate(self.doctor)
+
+    def statuses(self, client=None):
+        return [row['status'] for row in (client or self.client).get(self.url).data['results']]
+
+    def test_repeat_list_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+
+    def test_writes_invalidate_patient_and_doctor_after_commit(self):
+        self.assertEqual(self.statuses(), ['CONFIRMED'])
+        self.assertEqual(self.statuses(self.doctor_client), ['CONFIRMED'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(f'{self.url}{self.appointment_id}/cancel/')
+        # Until the transaction commits, readers keep the old version's responses.
+        self.assertEqual(self.statuses(), ['CONFIRMED'])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.statuses(), ['CANCELED'])
+        self.assertEqual(self.statuses(self.doctor_client), ['CANCELED'])
+
+    def test_bulk_cancel_invalidates_patients(self):
+        self.statuses()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor_client.post(f'{self.url}doctor_bulk_cancel/')
+        self.assertEqual(self.statuses(), ['CANCELED'])
+
+    def test_other_users_keep_their_cache(self):
+        other = make_patient('other')
+        client = APIClient()
+        client.force_authenticate(other)
+        client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(slot(hour=10))
+        with self.assertNumQueries(0):
+            client.get(self.url)
+
+
+class WaitlistOfferTests(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.when = slot()
+        self.appointment_id = self.book(self.when).data['id']
+        self.waiting = [make_patient('first'), make_patient('second')]
+        for age, patient in zip((20, 10), self.waiting):
+            entry = Waitlist.objects.create(doctor=self.doctor, patient=patient, desired_date=self.when.date())
+            Waitlist.objects.filter(pk=entry.pk).update(created_at=timezone.now() - timedelta(minutes=age))
+
+    def free_the_slot(self):
+        self.client.post(f'/api/appointments/appointments/{self.appointment_id}/cancel/')
+        message = OutboxMessage.objects.get(task='appointments.tasks.offer_freed_slot')
+        offer_freed_slot(*message.args)
+        return WaitlistOffer.objects.select_related('appointment').order_by('-id').first()
+
+    def accept(self, offer, patient):
+        client = APIClient()
+        client.force_authenticate(patient)
+        return client.post(f'/api/appointments/waitlist/offers/{offer.id}/accept/')
+
+    def test_freed_slot_is_held_for_the_oldest_entry(self):
+        offer = self.free_the_slot()
+        self.assertEqual(offer.appointment.patient, self.waiting[0])
+        self.assertEqual((offer.appointment.status, offer.appointment.appointment_date), ('PENDING', self.when))
+        self.assertEqual(list(Waitlist.objects.values_list('patient', flat=True)), [self.waiting[1].id])
+        expiry = OutboxMessage.objects.get(task='appointments.tasks.expire_waitlist_offer')
+        self.assertEqual((expiry.args, expiry.available_at), ([offer.id], offer.expires_at))
+        self.assertTrue(OutboxMessage.objects.filter(task='appointments.tasks.send_waitlist_offer').exists())
+
+    def test_accept_confirms_the_hold(self):
+        offer = self.free_the_slot()
+        self.assertEqual(self.accept(offer, self.waiting[1]).status_code, 404)
+        response = self.accept(offer, self.waiting[0])
+        self.assertEqual(response.status_code, 200)
+        offer.refresh_from_db()
+        offer.appointment.refresh_from_db()
+        self.assertEqual((offer.status, offer.appointment.status), ('ACCEPTED', 'CONFIRMED'))
+        self.assertEqual(DoctorDaySchedule.objects.get(doctor=self.doctor).confirmed_count, 1)
+        self.assertEqual(self.accept(offer, self.waiting[0]).status_code, 409)
+
+    def test_expired_offer_passes_to_the_next_entry(self):
+        offer = self.free_the_slot()
+        WaitlistOffer.objects.filter(pk=offer.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.accept(offer, self.waiting[0]).status_code, 409)
+        next_offer = expire_offer(offer.id)
+        offer.refresh_from_db()
+        self.assertEqual(offer.status, 'EXPIRED')
+        self.assertEqual(Appointment.objects.get(pk=offer.appointment_id).status, 'CANCELED')
+        self.assertEqual(next_offer.appointment.patient, self.waiting[1])
+        self.assertEqual(next_offer.appointment.appointment_date, self.when)
+        self.assertFalse(Waitlist.objects.exists())
+        # A second expiry run for the same offer is a no-op.
+        self.assertIsNone(expire_offer(offer.id))
+
+    @skipUnlessDBFeature('has_select_for_update_of')
+    def test_offer_lock_leaves_the_hold_to_the_day_lock(self):
+        offer = self.free_the_slot()
+        WaitlistOffer.objects.filter(pk=offer.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        with CaptureQueriesContext(connection) as queries:
+            expire_offer(offer.id)
+        # The first lock taken is the offer's, and it must not extend to the joined appointment.
+        first_lock = next(query['sql'] for query in queries if 'FOR UPDATE' in query['sql'])
+        self.assertTrue(first_lock.endswith(f'FOR UPDATE OF "{WaitlistOffer._meta.db_table}" SKIP LOCKED'))
+
+    def test_slot_booked_directly_keeps_the_queue(self):
+        self.client.post(f'/api/appointments/appointments/{self.appointment_id}/cancel/')
+        self.assertEqual(self.book(self.when).status_code, 201)
+        message = OutboxMessage.objects.get(task='appointments.tasks.offer_freed_slot')
+        offer_freed_slot(*message.args)
+        self.assertFalse(WaitlistOffer.objects.exists())
+        self.assertEqual(Waitlist.objects.count(), 2)
+
+
+class NearestRescheduleTests(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.appointment_id = self.book(slot()).data['id']
+        other = make_patient('other')
+        for minute in (0, 20):
+            book_appointment(doctor_id=self.doctor.id, patient_id=other.id,
+                             appointment_date=slot(days=6, hour=8, minute=minute), status='CONFIRMED')
+
+    def reschedule(self, **data):
+        return self.client.post(f'/api/appointments/appointments/{self.appointment_id}/reschedule/?mode=nearest',
+                                data, format='json')
+
+    def test_claims_the_first_free_slot_from_the_start(self):
+        response = self.reschedule(appointment_date=slot(days=6, hour=8).isoformat())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['appointment_date'], slot(days=6, hour=8, minute=40))
+        self.assertEqual(Appointment.objects.get(pk=self.appointment_id).appointment_date,
+                         slot(days=6, hour=8, minute=40))
+
+    def test_off_grid_start_rounds_up(self):
+        response = self.reschedule(appointment_date=slot(days=6, hour=8, minute=5).isoformat())
+        self.assertEqual(response.data['appointment_date'], slot(days=6, hour=8, minute=40))
+
+    def test_start_beyond_the_window_is_rejected(self):
+        response = self.reschedule(appointment_date=slot(days=30).isoformat())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Appointment.objects.get(pk=self.appointment_id).appointment_date, slot())
+
+
+class OptimisticConcurrencyTests(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.appointment_id = self.book(slot()).data['id']
+
+    def post(self, action, **data):
+        return self.client.post(f'/api/appointments/appointments/{self.appointment_id}/{action}/', data, format='json')
+
+    def test_each_transition_bumps_the_version(self):
+        response = self.post('reschedule', appointment_date=slot(hour=10).isoformat(), version=1)
+        self.assertEqual((response.status_code, response.data['version']), (200, 2))
+        response = self.post('cancel', version=2)
+        self.assertEqual((response.status_code, response.data['version']), (200, 3))
+
+    def test_admin_cannot_edit_but_can_cancel(self):
+        admin_user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        browser = Client()
+        browser.force_login(admin_user)
+        url = f'/admin/appointments/appointment/{self.appointment_id}/change/'
+        browser.post(url, {'doctor': self.doctor.id, 'patient': self.patient.id, 'status': 'PENDING',
+                           'appointment_date_0': slot(hour=11).date().isoformat(), 'appointment_date_1': '11:00:00'})
+        appointment = Appointment.objects.get(pk=self.appointment_id)
+        self.assertEqual((appointment.status, appointment.appointment_date, appointment.version), ('CONFIRMED', slot(), 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            browser.post('/admin/appointments/appointment/', {
+                'action': 'cancel_selected', '_selected_action': [self.appointment_id],
+            })
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.status, appointment.version), ('CANCELED', 2))
+        self.assertEqual(DoctorDaySchedule.objects.get(doctor=self.doctor).booked_slots, [])
+
+    def test_stale_version_is_a_conflict(self):
+        self.post('reschedule', appointment_date=slot(hour=10).isoformat())
+        response = self.post('cancel', version=1)
+        self.assertEqual(response.status_code, 409)
+        appointment = Appointment.objects.get(pk=self.appointment_id)
+        self.assertEqual((appointment.status, appointment.version), ('RESCHEDULED', 2))
+        self.assertEqual(DoctorDaySchedule.objects.get(doctor=self.doctor).booked_slots, ['10:00'])
+
+    def test_concurrent_writer_loses(self):
+        first = Appointment.objects.get(pk=self.appointment_id)
+        second = Appointment.objects.get(pk=self.appointment_id)
+        cancel_appointment(first)
+        with self.assertRaises(ConflictError):
+            cancel_appointment(second)
+        self.assertEqual(DoctorProfile.objects.get(user=self.doctor).current_appointments, 0)
+
+    def test_canceled_is_final(self):
+        self.assertEqual(self.post('cancel').status_code, 200)
+        self.assertEqual(self.post('cancel').status_code, 409)
+        self.assertEqual(self.post('reschedule', appointment_date=slot(hour=10).isoformat()).status_code, 409)
+        self.assertEqual(Appointment.objects.get(pk=self.appointment_id).version, 2)
+
+    def test_version_must_be_a_number(self):
+        self.assertEqual(self.post('cancel', version='latest').status_code, 400)
+
+
+class StaleHoldSweepTests(AppointmentTestCase):
+    def hold(self, hour, age_minutes=60):
+        appointment = book_appointment(
+            doctor_id=self.doctor.id, patient_id=self.patient.id, appointment_date=slot(hour=hour), status='PENDING'
+        )
+        Appointment.objects.filter(pk=appointment.pk).update(created_at=timezone.now() - timedelta(minutes=age_minutes))
+        return appointment
+
+    def pay(self, appointment, status, age_minutes):
+        payment = Payment.objects.create(appointment=appointment, amount='20.00', status=status)
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(minutes=age_minutes))
+
+    def test_only_abandoned_holds_are_released(self):
+        abandoned = self.hold(9)
+        self.pay(abandoned, 'CREATED', age_minutes=600)
+        failed = self.hold(10)
+        self.pay(failed, 'FAILED', age_minutes=600)
+        expired_offer = self.hold(11)
+        WaitlistOffer.objects.create(appointment=expired_offer, status='EXPIRED', expires_at=timezone.now())
+        awaiting_confirmation = self.hold(12)
+        paid = self.hold(13)
+        self.pay(paid, 'COMPLETED', age_minutes=600)
+        paying = self.hold(14)
+        self.pay(paying, 'PENDING', age_minutes=5)
+        live_offer = self.hold(15)
+        self.pay(live_offer, 'CREATED', age_minutes=600)
+        WaitlistOffer.objects.create(appointment=live_offer, expires_at=timezone.now() + timedelta(minutes=10))
+        recent = self.hold(16, age_minutes=5)
+        self.pay(recent, 'CREATED', age_minutes=600)
+
+        self.assertEqual(expire_stale_appointments(), 3)
+
+        canceled = set(Appointment.objects.filter(status='CANCELED').values_list('id', flat=True))
+        self.assertEqual(canceled, {abandoned.id, failed.id, expired_offer.id})
+        self.assertEqual(OutboxMessage.objects.filter(task='appointments.tasks.offer_freed_slot').count(), 3)
+        self.assertEqual(len(self.doctor.day_schedules.get().booked_slots), 5)
+
+    def test_hold_paid_while_the_day_is_locked_is_kept(self):
+        abandoned = self.hold(9)
+        self.pay(abandoned, 'CREATED', age_minutes=600)
+        paid = self.hold(10)
+        self.pay(paid, 'CREATED', age_minutes=600)
+        now = timezone.now()
+
+        def pay_while_locking(doctor_id, day):
+            # The candidates are read before any lock; a payment lands before the UPDATE.
+            Payment.objects.filter(appointment=paid).update(status='COMPLETED')
+            return lock_day(doctor_id, day)
+
+        with mock.patch.object(services, 'lock_day', side_effect=pay_while_locking):
+            released = services.expire_stale_pending(now, now, batch_size=10)
+        self.assertEqual([row[0] for row in released], [abandoned.id])
+        self.assertEqual(Appointment.objects.get(pk=paid.pk).status, 'PENDING')
+
+
+class ImporterTests(AppointmentTestCase):
+    def row(self, when, doctor=None, patient=None, status='CONFIRMED'):
+        return {
+            'doctor': (doctor or self.doctor).id, 'patient': (patient or self.patient).id,
+            'appointment_date': when.isoformat(), 'status': status,
+        }
+
+    def run_import(self, rows, **options):
+        result = AppointmentImporter(**options).run(rows)
+        return result['created'], {error['row']: error['errors'] for error in result['errors']}
+
+    def test_rejections_are_reported_per_row(self):
+        book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id, appointment_date=slot(hour=8))
+        rows = [
+            self.row(slot(hour=9)),
+            self.row(slot(hour=9)),
+            self.row(slot(hour=8)),
+            {'doctor': self.patient.id, 'patient': self.patient.id, 'appointment_date': slot(hour=10).isoformat()},
+            {'doctor': self.doctor.id, 'patient': 999999, 'appointment_date': slot(hour=10).isoformat()},
+            self.row(timezone.now() - timedelta(days=1)),
+            self.row(slot(hour=11), status='CANCELED'),
+            None,
+        ]
+        created, errors = self.run_import(rows, batch_size=3)
+        self.assertEqual(created, 1)
+        self.assertEqual(errors[2], ["appointment_date: duplicate slot earlier in the file."])
+        self.assertEqual(errors[3], ["appointment_date: this time slot is already booked."])
+        self.assertEqual(errors[4], ["doctor: no doctor with this id."])
+        self.assertEqual(errors[5], ["patient: no user with this id."])
+        self.assertIn("appointment_date: must be in the future.", errors[6])
+        self.assertIn("status: must be one of PENDING, CONFIRMED.", errors[7])
+        self.assertEqual(len(errors[8]), 1)
+        self.assertEqual(sorted(errors), [2, 3, 4, 5, 6, 7, 8])
+
+    def test_duplicates_are_caught_across_batches(self):
+        created, errors = self.run_import([self.row(slot(hour=9)), self.row(slot(hour=10)),
+                                           self.row(slot(hour=9))], batch_size=2)
+        self.assertEqual(created, 2)
+        self.assertEqual(errors, {3: ["appointment_date: duplicate slot earlier in the file."]})
+
+    def test_rejected_row_does_not_claim_its_slot(self):
+        doctor = make_doctor('capped', max_appointments=1)
+        rows = [
+            self.row(slot(hour=9), doctor=doctor),
+            self.row(slot(hour=10), doctor=doctor),
+            self.row(slot(hour=10), doctor=doctor, status='PENDING'),
+        ]
+        created, errors = self.run_import(rows)
+        self.assertEqual(created, 2)
+        self.assertEqual(errors, {2: ["Doctor has reached the maximum number of appointments for this day."]})
+        self.assertEqual(doctor.day_schedules.get().confirmed_count, 1)
+
+    def test_off_grid_rows_are_rejected(self):
+        rows = [self.row(slot(hour=9, minute=10)), self.row(slot(hour=22)), self.row(slot(hour=9) + timedelta(seconds=30))]
+        created, errors = self.run_import(rows)
+        self.assertEqual(created, 0)
+        self.assertEqual(errors, {number: [f"appointment_date: {SLOT_GRID_ERROR}"] for number in (1, 2, 3)})
+
+    def test_dry_run_saves_nothing(self):
+        created, errors = self.run_import([self.row(slot(hour=9)), self.row(slot(hour=9))], dry_run=True)
+        self.assertEqual((created, list(errors)), (1, [2]))
+        self.assertFalse(Appointment.objects.exists())
+
+
+class AvailabilityTests(AppointmentTestCase):
+    def test_booked_slot_leaves_the_open_list(self):
+        when = slot()
+        self.assertEqual(self.book(when).status_code, 201)
+        response = self.client.get('/api/appointments/availability/', {'doctor': self.doctor.id})
+        self.assertEqual(response.status_code, 200)
+        day = next(day for day in response.data['days'] if day['date'] == when.date())
+        self.assertNotIn('09:00', day['open_slots'])
+        self.assertIn('09:20', day['open_slots'])
+
+    def test_malformed_dates_are_rejected(self):
+        for params in ({'from': 'tomorrow'}, {'to': '2025-13-45'}):
+            response = self.client.get('/api/appointments/availability/', {'doctor': self.doctor.id, **params})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(next(iter(params)), response.data)
+
+    def test_booking_must_be_on_the_slot_grid(self):
+        for when in (slot(minute=10), slot() + timedelta(seconds=30), slot(hour=7), slot(hour=18)):
+            response = self.book(when)
+            self.assertEqual(response.status_code, 400, when)
+            self.assertIn('appointment_date', response.data)
+        self.assertFalse(Appointment.objects.exists())
+
+
+
+class ScheduleGridTests(AppointmentTestCase):
+    url = '/api/appointments/appointments/schedule/'
+
+    def setUp(self):
+        super().setUp()
+        DoctorProfile.objects.filter(user=self.doctor).update(max_appointments=3)
+        self.book(slot(hour=9))
+        self.book(slot(hour=11))
+        cancel_appointment(Appointment.objects.get(pk=self.book(slot(hour=10)).data['id']))
+        book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id,
+                         appointment_date=slot(days=7, hour=8), status='PENDING')
+        self.doctor_client = APIClient()
+        self.doctor_client.force_authenticate(self.doctor)
+
+    def get(self, **params):
+        return self.doctor_client.get(self.url, params)
+
+    def test_columns_are_indexed_by_day(self):
+        response = self.get(**{'from': slot().date().isoformat(), 'to': slot(days=7).date().isoformat()})
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(data['days'], [slot(days=days).date() for days in (5, 6, 7)])
+        column = {name: data['statuses'].index(name) for name in ('PENDING', 'CONFIRMED', 'CANCELED')}
+        first, empty, last = data['counts']
+        self.assertEqual((first[column['CONFIRMED']], first[column['CANCELED']], first[column['PENDING']]), (2, 1, 0))
+        self.assertEqual(empty, [0] * len(data['statuses']))
+        self.assertEqual(last[column['PENDING']], 1)
+        self.assertEqual(data['remaining'], [1, 3, 3])
+        self.assertEqual(data['booked'], [['09:00', '11:00'], [], ['08:00']])
+
+    def test_defaults_to_the_booking_window(self):
+        data = self.get().data
+        self.assertEqual(data['days'][0], timezone.localdate())
+        self.assertEqual(len(data['days']), settings.APPOINTMENT_BOOKING_WINDOW_DAYS + 1)
+
+    def test_doctors_only(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_range_is_validated(self):
+        today = timezone.localdate()
+        for days in (-1, 32):
+            params = {'from': today.isoformat(), 'to': (today + timedelta(days=days)).isoformat()}
+            self.assertEqual(self.get(**params).status_code, 400)
+        self.assertEqual(self.get(**{'from': 'monday'}).status_code, 400)
+
+
+class CalendarFeedTests(AppointmentTestCase):
+    url = '/api/appointments/calendar/'
+
+    def setUp(self):
+        super().setUp()
+        self.appointment_id = self.book(slot()).data['id']
+
+    def feed_path(self, response):
+        return urlparse(response.data['url']).path
+
+    def test_rotating_the_token_revokes_the_old_url(self):
+        old = self.feed_path(self.client.get(self.url))
+        self.assertEqual(self.feed_path(self.client.get(self.url)), old)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 201)
+        new = self.feed_path(response)
+        self.assertNotEqual(new, old)
+        self.assertEqual(Client().get(old).status_code, 404)
+        self.assertEqual(Client().get(new).status_code, 200)
+
+    def test_feed_lists_events_and_answers_304_until_something_changes(self):
+        path = self.feed_path(self.client.get(self.url))
+        response = Client().get(path)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertIn(f'UID:appointment-{self.appointment_id}@doctor-visit-app\r\n', body)
+        self.assertIn('SUMMARY:Appointment with Dr. doc\r\nSTATUS:CONFIRMED\r\n', body)
+
+        etag = response['ETag']
+        self.assertEqual(Client().get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(f'/api/appointments/appointments/{self.appointment_id}/cancel/')
+        response = Client().get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('STATUS:CANCELLED\r\n', b''.join(response.streaming_content).decode())
+
+    def test_text_is_escaped(self):
+        self.assertEqual(ics.escape('a,b;c\\d\ne'), 'a\\,b\\;c\\\\d\\ne')
+
+    def test_long_lines_fold_at_75_octets(self):
+        line = 'SUMMARY:' + 'Ärztin ' * 30
+        folded = ics.fold(line)
+        self.assertTrue(folded.endswith('\r\n'))
+        physical = folded[:-2].split('\r\n')
+        self.assertGreater(len(physical), 1)
+        self.assertTrue(all(len(part.encode()) <= 75 for part in physical))
+        self.assertTrue(all(part.startswith(' ') for part in physical[1:]))
+        self.assertEqual(''.join([physical[0]] + [part[1:] for part in physical[1:]]), line)
+        self.assertEqual(ics.fold('SUMMARY:short'), 'SUMMARY:short\r\n')
+
+class IdempotencyTests(AppointmentTestCase):
+    def test_retry_replays_the_first_response(self):
+        first = self.book(slot(), HTTP_IDEMPOTENCY_KEY='booking-1')
+        retry = self.book(slot(), HTTP_IDEMPOTENCY_KEY='booking-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        self.book(slot(), HTTP_IDEMPOTENCY_KEY='shared')
+        other = make_patient('other')
+        client = APIClient()
+        client.force_authenticate(other)
+        data = {'doctor': self.doctor.id, 'patient': other.id, 'appointment_date': slot(hour=10).isoformat()}
+        response = client.post('/api/appointments/appointments/', data, format='json', HTTP_IDEMPOTENCY_KEY='shared')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_reused_key_with_another_body_is_rejected(self):
+        self.book(slot(), HTTP_IDEMPOTENCY_KEY='booking-1')
+        response = self.book(slot(hour=10), HTTP_IDEMPOTENCY_KEY='booking-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    @mock.patch.object(idempotency, 'POLL_INTERVAL', 0.01)
+    def test_duplicate_in_flight_gets_409(self):
+        with self.settings(IDEMPOTENCY_WAIT_SECONDS=0.05), mock.patch.object(idempotency.cache, 'add', return_value=False):
+            response = self.book(slot(), HTTP_IDEMPOTENCY_KEY='booking-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_lock_is_released_only_by_its_holder(self):
+        # A handler that outlived its lock must leave the duplicate's lock in place.
+        cache.set('lock', 'duplicate-token')
+        idempotency.release('lock', 'expired-token')
+        self.assertEqual(cache.get('lock'), 'duplicate-token')
+        idempotency.release('lock', 'duplicate-token')
+        self.assertIsNone(cache.get('lock'))
+
+    def test_redis_lock_is_compared_and_deleted_in_one_step(self):
+        redis_cache = RedisCache('redis://localhost:6379/0', {})
+        client = mock.Mock()
+        with mock.patch.object(idempotency, 'cache', redis_cache), \
+                mock.patch.object(redis_cache._cache, 'get_client', return_value=client) as get_client:
+            idempotency.release('lock', 42)
+        key = redis_cache.make_and_validate_key('lock')
+        get_client.assert_called_once_with(key, write=True)
+        client.eval.assert_called_once_with(idempotency.RELEASE_SCRIPT, 1, key, 42)
+        client.get.assert_not_called()
+
+
+class DayScheduleBackfillTests(AppointmentTestCase):
+    def test_backfill_indexes_existing_appointments(self):
+        migration = import_module('appointments.migrations.0013_backfill_day_schedules')
+        other = make_patient('other')
+        # Rows written before the index existed, so nothing recorded them.
+        for when, patient, status in ((slot(hour=9), self.patient, 'CONFIRMED'), (slot(hour=10), other, 'PENDING'),
+                                      (slot(hour=11), other, 'CANCELED'), (slot(days=6), self.patient, 'RESCHEDULED')):
+            Appointment.objects.create(doctor=self.doctor, patient=patient, appointment_date=when, status=status)
+        Appointment.objects.create(doctor=self.doctor, patient=other, appointment_date=slot(days=-3), status='CONFIRMED')
+        DoctorDaySchedule.objects.create(doctor=self.doctor, date=slot().date(), booked_slots=['12:00'], confirmed_count=4)
+
+        migration.backfill_day_schedules(apps, None)
+
+        schedules = dict(DoctorDaySchedule.objects.values_list('date', 'booked_slots'))
+        self.assertEqual(schedules, {slot().date(): ['09:00', '10:00'], slot(days=6).date(): ['09:00']})
+        self.assertEqual(DoctorDaySchedule.objects.get(date=slot().date()).confirmed_count, 1)
+        self.assertEqual(self.book(slot(hour=10)).status_code, 400)
+
+
+class CurrentAppointmentsBackfillTests(AppointmentTestCase):
+    def test_backfill_counts_active_appointments(self):
+        migration = import_module('accounts.migrations.0003_backfill_current_appointments')
+        for hour, status in ((9, 'CONFIRMED'), (10, 'PENDING'), (11, 'CANCELED'), (12, 'RESCHEDULED')):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, appointment_date=slot(hour=hour),
+                                       status=status)
+        idle = make_doctor('idle')
+        DoctorProfile.objects.filter(user=idle).update(current_appointments=5)
+
+        migration.backfill_current_appointments(apps, None)
+
+        counts = dict(DoctorProfile.objects.values_list('user_id', 'current_appointments'))
+        self.assertEqual(counts, {self.doctor.id: 3, idle.id: 0})
+
+
+class BulkCancelTests(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ids = [self.book(when).data['id'] for when in (slot(), slot(hour=10), slot(days=6))]
+        cancel_appointment(Appointment.objects.get(pk=self.ids[1]))
+
+    def test_cancels_active_rows_and_rebuilds_their_days(self):
+        canceled = bulk_cancel(Appointment.objects.filter(doctor=self.doctor))
+        self.assertEqual(sorted(canceled), [self.ids[0], self.ids[2]])
+        self.assertEqual(list(DoctorDaySchedule.objects.values_list('booked_slots', 'confirmed_count')), [([], 0)] * 2)
+        self.assertEqual(DoctorProfile.objects.get(user=self.doctor).current_appointments, 0)
+        self.assertEqual(bulk_cancel(Appointment.objects.filter(doctor=self.doctor)), [])
+
+    def test_days_are_locked_before_the_update(self):
+        events = []
+
+        def record_update(execute, sql, params, many, context):
+            if sql.startswith(f'UPDATE {Appointment._meta.db_table}'):
+                events.append('update')
+            return execute(sql, params, many, context)
+
+        def record_lock(doctor_id, day):
+            events.append(day)
+            return lock_day(doctor_id, day)
+
+        with mock.patch.object(services, 'lock_day', side_effect=record_lock), connection.execute_wrapper(record_update):
+            bulk_cancel(Appointment.objects.filter(doctor=self.doctor))
+        self.assertEqual(events, [slot().date(), slot(days=6).date(), 'update'])
+
+
+class SparseFieldsetTests(AppointmentTestCase):
+    url = '/api/appointments/appointments/'
+
+    def setUp(self):
+        super().setUp()
+        self.appointment_id = self.book(slot()).data['id']
+
+    def get(self, url=None, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url or self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, ' '.join(query['sql'] for query in queries)
+
+    def test_fields_narrow_the_rows(self):
+        response, sql = self.get(fields='id,status')
+        self.assertEqual(response.data['results'], [{'id': self.appointment_id, 'status': 'CONFIRMED'}])
+        self.assertNotIn('JOIN', sql)
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'fields': 'id,notes'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'expand': 'payments'}).status_code, 400)
+
+    def test_expand_joins_only_the_expanded_user(self):
+        response, sql = self.get(fields='id,doctor,patient', expand='doctor')
+        row = response.data['results'][0]
+        self.assertEqual(row['patient'], self.patient.id)
+        self.assertEqual(row['doctor'], {'id': self.doctor.id, 'username': 'doc', 'first_name': '', 'last_name': ''})
+        self.assertEqual(sql.count('JOIN'), 1)
+
+    def test_expand_of_an_unselected_field_is_ignored(self):
+        response, sql = self.get(fields='id', expand='doctor')
+        self.assertEqual(response.data['results'], [{'id': self.appointment_id}])
+        self.assertNotIn('JOIN', sql)
+
+    def test_detail_accepts_fields_and_expand(self):
+        response, _ = self.get(f'{self.url}{self.appointment_id}/', fields='status,patient', expand='patient')
+        self.assertEqual(response.data, {
+            'status': 'CONFIRMED',
+            'patient': {'id': self.patient.id, 'username': 'pat', 'first_name': '', 'last_name': ''},
+        })
+
+
+
+class ArchiveTests(AppointmentTestCase):
+    def test_batches_take_the_oldest_appointments_first(self):
+        # Ids do not follow dates: the newer appointment was booked first.
+        newer, older, live = [
+            book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id, appointment_date=when).id
+            for when in (slot(days=-100), slot(days=-300), slot())
+        ]
+        cutoff = archive.archive_cutoff()
+        self.assertEqual(archive.archive_batch(cutoff, batch_size=1), 1)
+        self.assertEqual(list(ArchivedAppointment.objects.values_list('id', flat=True)), [older])
+        self.assertEqual(archive.archive_batch(cutoff, batch_size=1), 1)
+        self.assertEqual(archive.archive_batch(cutoff, batch_size=1), 0)
+        self.assertEqual(list(Appointment.objects.values_list('id', flat=True)), [live])
+        self.assertEqual(sorted(ArchivedAppointment.objects.values_list('id', flat=True)), sorted([newer, older]))
+
+
+@override_settings(ROLLUP_LAG_SECONDS=0)
+class DoctorStatsRollupTests(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = Appointment.objects.get(pk=self.book(slot(hour=9)).data['id'])
+        cancel_appointment(Appointment.objects.get(pk=self.book(slot(hour=10)).data['id']))
+        book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id,
+                         appointment_date=slot(days=6), status='PENDING')
+
+    def stats(self, days=5):
+        return DoctorDayStats.objects.get(doctor=self.doctor, date=slot(days=days).date())
+
+    def test_refresh_folds_changes_and_advances_the_watermark(self):
+        self.assertEqual(rollup.refresh(), 2)
+        day = self.stats()
+        self.assertEqual((day.booked, day.confirmed, day.canceled), (1, 1, 1))
+        self.assertEqual((self.stats(days=6).booked, self.stats(days=6).pending), (1, 1))
+        watermark = RollupWatermark.objects.get(name=rollup.WATERMARK).value
+        # Nothing changed since: the next run reads past the watermark and finds no days.
+        self.assertEqual(rollup.refresh(), 0)
+        self.assertGreater(RollupWatermark.objects.get(name=rollup.WATERMARK).value, watermark)
+        self.assertEqual(rollup.refresh(full=True), 2)
+
+    def test_moved_appointment_refreshes_both_days(self):
+        rollup.refresh()
+        services.reschedule_appointment(self.first, slot(days=7))
+        self.assertEqual(rollup.refresh(), 2)
+        self.assertEqual((self.stats().booked, self.stats().canceled), (0, 1))
+        self.assertEqual((self.stats(days=7).booked, self.stats(days=7).rescheduled), (1, 1))
+
+    def test_revenue_counts_completed_payments_only(self):
+        payments = [('20.00', 'COMPLETED'), ('15.00', 'COMPLETED'), ('5.00', 'FAILED'), ('7.00', 'PENDING')]
+        for amount, payment_status in payments:
+            Payment.objects.create(appointment=self.first, amount=amount, status=payment_status)
+        rollup.refresh()
+        day = self.stats()
+        self.assertEqual(day.revenue, Decimal('35.00'))
+        # Several payments on one appointment still count it once.
+        self.assertEqual(day.confirmed, 1)
+
+    def test_dashboard_is_staff_only_and_filters_by_doctor(self):
+        rollup.refresh()
+        staff = make_patient('staff')
+        CustomUser.objects.filter(pk=staff.pk).update(is_staff=True)
+        url = '/api/appointments/stats/doctors/'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(CustomUser.objects.get(pk=staff.pk))
+        params = {'date_from': slot().date().isoformat(), 'date_to': slot(days=6).date().isoformat()}
+        rows = self.client.get(url, {**params, 'doctor': self.doctor.id}).data
+        self.assertEqual([(row['date'], row['booked'], row['cancel_rate']) for row in rows],
+                         [(slot().date(), 1, 0.5), (slot(days=6).date(), 1, 0.0)])
+        self.assertEqual(self.client.get(url, {**params, 'doctor': self.patient.id}).data, [])
+        self.assertEqual(self.client.get(url, {**params, 'doctor': 'me'}).status_code, 400)
+        reversed_range = {'date_from': params['date_to'], 'date_to': params['date_from']}
+        self.assertEqual(self.client.get(url, reversed_range).status_code, 400)
+
+class ExportTests(AppointmentTestCase):
+    url = '/api/appointments/export/appointments.'
+
+    def setUp(self):
+        super().setUp()
+        self.paid_id = self.book(slot()).data['id']
+        self.unpaid_id = self.book(slot(days=6)).data['id']
+        Payment.objects.create(appointment_id=self.paid_id, amount='20.00', status='COMPLETED', transaction_id='T1')
+        staff = make_patient('staff')
+        staff.is_staff = True
+        staff.save()
+        self.staff = APIClient()
+        self.staff.force_authenticate(staff)
+
+    def download(self, fmt, **params):
+        response = self.staff.get(self.url + fmt, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(self.url + 'csv').status_code, 403)
+        self.assertEqual(self.staff.get(self.url + 'xml').status_code, 404)
+
+    def test_csv_has_one_row_per_payment(self):
+        rows = list(csv.DictReader(io.StringIO(self.download('csv').decode())))
+        self.assertEqual([row['appointment_id'] for row in rows], [str(self.paid_id), str(self.unpaid_id)])
+        self.assertEqual((rows[0]['payment_amount'], rows[0]['payment_transaction_id']), ('20.00', 'T1'))
+        self.assertEqual(rows[1]['payment_id'], '')
+
+    def test_jsonl_is_filtered_by_date(self):
+        day = slot().date().isoformat()
+        lines = self.download('jsonl', date_from=day, date_to=day).decode().splitlines()
+        self.assertEqual([json.loads(line)['appointment_id'] for line in lines], [self.paid_id])
+        self.assertEqual(self.staff.get(self.url + 'jsonl', {'date_from': 'soon'}).status_code, 400)
+
+    def test_archived_appointments_are_included(self):
+        old_id = book_appointment(doctor_id=self.doctor.id, patient_id=self.patient.id,
+                                  appointment_date=slot(days=-200)).id
+        Payment.objects.create(appointment_id=old_id, amount='15.00', status='COMPLETED')
+        Payment.objects.create(appointment_id=old_id, amount='5.00', status='FAILED')
+        archive.archive_batch(archive.archive_cutoff())
+        rows = list(csv.DictReader(io.StringIO(self.download('csv').decode())))
+        self.assertEqual([(row['appointment_id'], row['payment_amount']) for row in rows], [
+            (str(old_id), '15.00'), (str(old_id), '5.00'), (str(self.paid_id), '20.00'), (str(self.unpaid_id), ''),
+        ])
+        day = slot(days=-200).date().isoformat()
+        self.assertEqual(len(self.download('csv', date_from=day, date_to=day).splitlines()), 3)
+
+    def test_gzip_matches_the_plain_export(self):
+        self.assertEqual(gzip.decompress(self.download('csv.gz')), self.download('csv'))
+
+    def test_command_writes_the_same_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'appointments.jsonl.gz')
+            call_command('export_appointments', output=path, date_from=slot(days=6).date().isoformat(), stderr=io.StringIO())
+            with open(path, 'rb') as exported:
+                lines = gzip.decompress(exported.read()).decode().splitlines()
+        self.assertEqual([json.loads(line)['appointment_id'] for line in lines], [self.unpaid_id])
+        with self.assertRaises(CommandError):
+            call_command('export_appointments', date_from='soon')
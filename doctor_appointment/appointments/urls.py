@@ -1,11 +1,22 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AppointmentViewSet, WaitlistEntryCreateView
+from .views import (
+    AppointmentExportView, AppointmentImportView, AppointmentViewSet, CalendarFeedTokenView,
+    CalendarFeedView, DoctorAvailabilityView, DoctorStatsView, WaitlistEntryCreateView,
+    WaitlistOfferAcceptView,
+)
 
 router = DefaultRouter()
 router.register(r'appointments', AppointmentViewSet, basename='appointment')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('availability/', DoctorAvailabilityView.as_view(), name='doctor-availability'),
     path('waitlist/', WaitlistEntryCreateView.as_view(), name='waitlist-create'),
+    path('waitlist/offers/<int:pk>/accept/', WaitlistOfferAcceptView.as_view(), name='waitlist-offer-accept'),
+    path('calendar/', CalendarFeedTokenView.as_view(), name='calendar-token'),
+    path('calendar/<str:token>.ics', CalendarFeedView.as_view(), name='calendar-feed'),
+    path('export/appointments.<str:fmt>', AppointmentExportView.as_view(), name='appointment-export'),
+    path('import/', AppointmentImportView.as_view(), name='appointment-import'),
+    path('stats/doctors/', DoctorStatsView.as_view(), name='doctor-stats'),
 ]
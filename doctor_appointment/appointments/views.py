@@ -1,26 +1,182 @@
 from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
-from .models import Appointment
-from .serializers import AppointmentSerializer, WaitlistSerializer
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from .models import Appointment, CalendarFeed, DoctorDayStats, WaitlistOffer
+from .serializers import (
+    SLOT_GRID_ERROR, AppointmentFieldSet, AppointmentSerializer, ArchivedAppointmentSerializer, WaitlistSerializer,
+)
+from .pagination import AppointmentCursorPagination
+from .params import parse_bound, parse_day
+from . import archive, availability, conditional, export, ics
+from .idempotency import idempotent
+from .importer import AppointmentImporter, import_file
+from . import cache as response_cache
+from .services import (
+    BookingError, ConflictError, TransitionError, bulk_cancel, cancel_appointment,
+    reschedule_appointment, reschedule_to_nearest,
+)
+from .waitlist import OfferError, accept_offer, enqueue_freed_slot
+from notifications import outbox
 from rest_framework import generics
 
+def expected_version(request):
+    # Optional "version" from the client: the change only applies if nobody else moved the row since.
+    value = request.data.get('version')
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({"version": "A whole number is required."})
+
+
 class AppointmentViewSet(viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AppointmentCursorPagination
+    schedule_max_days = 31
+    # No PUT/PATCH/DELETE: a plain save or delete would bypass the day index and the
+    # status rules. Changes go through the cancel and reschedule actions.
+    http_method_names = ['get', 'post', 'head', 'options']
 
     def get_queryset(self):
         user = self.request.user
         # Assuming your user model has an attribute "is_doctor" to differentiate roles.
         if getattr(user, "is_doctor", False):
             # For doctors, return appointments where they are the assigned doctor.
-            return Appointment.objects.filter(doctor=user).select_related('patient')
-        # For patients, return appointments where they are the patient.
-        return Appointment.objects.filter(patient=user).select_related('doctor')
+            queryset = Appointment.objects.filter(doctor=user).select_related('patient')
+        else:
+            # For patients, return appointments where they are the patient.
+            queryset = Appointment.objects.filter(patient=user).select_related('doctor')
+        if self.action == 'list':
+            queryset = self.filter_list(queryset)
+        return queryset
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        # Retried bookings with the same Idempotency-Key get the first response back.
+        return super().create(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        cache_key, cached = response_cache.get_response(request)
+        if cached is not None:
+            data, etag = cached
+            response = conditional.not_modified(request, etag)
+            return response or conditional.with_validators(Response(data), etag)
+        # Lists always take the values() fast path; ?fields= / ?expand= narrow it further.
+        fieldset = AppointmentFieldSet.from_request(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        # Answer polling clients from one aggregate query when nothing changed.
+        etag = conditional.list_etag(request, queryset)
+        response = conditional.not_modified(request, etag)
+        if response is not None:
+            return response
+        queryset = queryset.values(*fieldset.columns())
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        data = [fieldset.to_representation(row) for row in rows]
+        if page is None:
+            response = Response(data)
+        else:
+            response = self.get_paginated_response(data)
+        response_cache.set_response(cache_key, (response.data, etag))
+        return conditional.with_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not str(kwargs['pk']).isdigit():
+            # The pk goes into raw filters below; anything but an id is simply not found.
+            raise Http404
+        cache_key, cached = response_cache.get_response(request)
+        if cached is not None:
+            data, etag, last_modified = cached
+            response = conditional.not_modified(request, etag, last_modified)
+            return response or conditional.with_validators(Response(data), etag, last_modified)
+        last_modified = self.get_queryset().filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        if last_modified is None:
+            # Past appointments move to the archive table; look there before giving up.
+            return self.retrieve_archived(request, kwargs['pk'])
+        etag = conditional.make_etag(request, last_modified.isoformat())
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        if 'fields' not in request.query_params and 'expand' not in request.query_params:
+            response = super().retrieve(request, *args, **kwargs)
+        else:
+            fieldset = AppointmentFieldSet.from_request(request)
+            row = get_object_or_404(self.get_queryset().values(*fieldset.columns()), pk=kwargs['pk'])
+            response = Response(fieldset.to_representation(row))
+        response_cache.set_response(cache_key, (response.data, etag, last_modified))
+        return conditional.with_validators(response, etag, last_modified)
+
+    def retrieve_archived(self, request, pk):
+        appointment = get_object_or_404(archive.history_for(request.user), pk=pk)
+        etag = conditional.make_etag(request, 'archived', appointment.updated_at.isoformat())
+        response = conditional.not_modified(request, etag, appointment.updated_at)
+        if response is None:
+            response = Response(ArchivedAppointmentSerializer(appointment).data)
+        return conditional.with_validators(response, etag, appointment.updated_at)
+
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """
+        Archived (past) appointments of the requesting user, with the same filters
+        and cursor pagination as the list endpoint.
+        """
+        queryset = self.filter_list(archive.history_for(request.user))
+        page = self.paginate_queryset(queryset)
+        serializer = ArchivedAppointmentSerializer(page if page is not None else queryset, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    def filter_list(self, queryset):
+        # Optional filters: date_from / date_to (ISO datetimes or dates) and status (comma-separated).
+        # Range filters on the raw column keep the (doctor|patient, appointment_date) index usable.
+        params = self.request.query_params
+        date_from = params.get('date_from')
+        date_to = params.get('date_to')
+        statuses = params.get('status')
+        if date_from:
+            queryset = queryset.filter(appointment_date__gte=parse_bound(date_from, 'date_from'))
+        if date_to:
+            queryset = queryset.filter(appointment_date__lt=parse_bound(date_to, 'date_to', end=True))
+        if statuses:
+            queryset = queryset.filter(status__in=[s.strip().upper() for s in statuses.split(',') if s.strip()])
+        return queryset
     
+    @action(detail=False, methods=['get'])
+    def schedule(self, request):
+        """
+        The requesting doctor's per-day grid for calendar views. Query params:
+        from / to (optional ISO dates, default today through the booking window).
+        """
+        if not getattr(request.user, "is_doctor", False):
+            return Response({"detail": "Only doctors can view their schedule."},
+                            status=status.HTTP_403_FORBIDDEN)
+        date_from = parse_day(request.query_params, 'from', timezone.localdate())
+        date_to = parse_day(request.query_params, 'to',
+                            date_from + timedelta(days=settings.APPOINTMENT_BOOKING_WINDOW_DAYS))
+        if date_to < date_from or (date_to - date_from).days > self.schedule_max_days:
+            return Response({"detail": f"'to' must be on or after 'from' and at most {self.schedule_max_days} days later."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        grid = availability.schedule_grid(request.user.id, date_from, date_to)
+        return Response({
+            "doctor": request.user.id,
+            "slot_minutes": settings.APPOINTMENT_SLOT_MINUTES,
+            **grid,
+        }, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         appointment = self.get_object()
@@ -28,37 +184,20 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if not appointment.can_cancel():
             return Response({"detail": "Cannot cancel appointment within 3 days of the scheduled time."},
                             status=status.HTTP_400_BAD_REQUEST)
-        appointment.status = 'CANCELED'
-        appointment.save()
-        # Trigger Celery task to notify waitlisted patients about the available slot.
-        from .tasks import notify_availability
-        notify_availability.delay(appointment.doctor.id, appointment.appointment_date.isoformat())
-        return Response({"detail": "Appointment canceled successfully."}, status=status.HTTP_200_OK)
+        try:
+            with transaction.atomic():
+                cancel_appointment(appointment, expected_version(request))
+                # Queue a Celery task to hand the freed slot to the waitlist.
+                enqueue_freed_slot(appointment.doctor_id, appointment.appointment_date)
+        except (ConflictError, TransitionError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({"detail": "Appointment canceled successfully.", "version": appointment.version},
+                        status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['post'])
     def reschedule(self, request, pk=None):
         appointment = self.get_object()
-        new_date = request.data.get('appointment_date')
-        if not new_date:
-            return Response({"detail": "New appointment date is required."}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            new_date_parsed = timezone.datetime.fromisoformat(new_date)
-            if timezone.is_naive(new_date_parsed):
-                new_date_parsed = timezone.make_aware(new_date_parsed)
-        except Exception:
-            return Response({"detail": "Invalid date format. Use ISO format."}, status=status.HTTP_400_BAD_REQUEST)
-        now = timezone.now()
-        if new_date_parsed < now:
-            return Response({"detail": "New appointment date must be in the future."}, status=status.HTTP_400_BAD_REQUEST)
-        if new_date_parsed > now + timedelta(days=15):
-            return Response({"detail": "New appointment date must be within 15 days."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        appointment.appointment_date = new_date_parsed
-        appointment.status = 'RESCHEDULED'
-        appointment.save()
-        from .tasks import notify_reschedule
-        notify_reschedule.delay(appointment.id)
-        return Response({"detail": "Appointment rescheduled successfully."}, status=status.HTTP_200_OK)
+        return self.perform_reschedule(request, appointment, "Appointment rescheduled successfully.")
     
     # Doctor-specific actions
     @action(detail=True, methods=['post'])
@@ -67,11 +206,15 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if request.user != appointment.doctor:
             return Response({"detail": "Only the assigned doctor can perform this action."},
                             status=status.HTTP_403_FORBIDDEN)
-        appointment.status = 'CANCELED'
-        appointment.save()
-        from .tasks import notify_doctor_cancellation
-        notify_doctor_cancellation.delay(appointment.id)
-        return Response({"detail": "Appointment canceled by doctor."}, status=status.HTTP_200_OK)
+        try:
+            with transaction.atomic():
+                cancel_appointment(appointment, expected_version(request))
+                outbox.enqueue('appointments.tasks.notify_doctor_cancellation', appointment.id,
+                               dedupe_key=f'appointment:{appointment.id}:doctor_cancel')
+        except (ConflictError, TransitionError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({"detail": "Appointment canceled by doctor.", "version": appointment.version},
+                        status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['post'])
     def doctor_bulk_cancel(self, request):
@@ -85,13 +228,13 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if patient_id:
             qs = qs.filter(patient_id=patient_id)
         if cancel_date:
-            qs = qs.filter(appointment_date__date=cancel_date)
-        appointments = list(qs)
-        count = qs.update(status='CANCELED')
-        from .tasks import notify_doctor_cancellation
-        for appointment in appointments:
-            notify_doctor_cancellation.delay(appointment.id)
-        return Response({"detail": f"Canceled {count} appointments."}, status=status.HTTP_200_OK)
+            qs = qs.on_day(cancel_date)
+        with transaction.atomic():
+            canceled_ids = bulk_cancel(qs)
+            if canceled_ids:
+                # One task for the whole batch; the worker chunks the ids itself.
+                outbox.enqueue('appointments.tasks.notify_bulk_doctor_cancellation', canceled_ids)
+        return Response({"detail": f"Canceled {len(canceled_ids)} appointments."}, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['post'])
     def doctor_reschedule(self, request, pk=None):
@@ -99,26 +242,92 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         if request.user != appointment.doctor:
             return Response({"detail": "Only the assigned doctor can reschedule this appointment."},
                             status=status.HTTP_403_FORBIDDEN)
+        return self.perform_reschedule(request, appointment, "Appointment rescheduled by doctor.")
+
+    def perform_reschedule(self, request, appointment, success_detail):
+        """
+        Shared body of reschedule and doctor_reschedule. With ?mode=nearest the
+        appointment_date is only where the search starts (default: now) and the
+        first free slot from there on is claimed and returned.
+        """
+        mode = request.query_params.get('mode') or request.data.get('mode') or 'exact'
+        if mode not in ('exact', 'nearest'):
+            return Response({"detail": "mode must be 'exact' or 'nearest'."}, status=status.HTTP_400_BAD_REQUEST)
         new_date = request.data.get('appointment_date')
-        if not new_date:
+        now = timezone.now()
+        if not new_date and mode == 'exact':
             return Response({"detail": "New appointment date is required."}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            new_date_parsed = timezone.datetime.fromisoformat(new_date)
+            new_date_parsed = timezone.datetime.fromisoformat(new_date) if new_date else now
             if timezone.is_naive(new_date_parsed):
                 new_date_parsed = timezone.make_aware(new_date_parsed)
         except Exception:
             return Response({"detail": "Invalid date format. Use ISO format."}, status=status.HTTP_400_BAD_REQUEST)
-        now = timezone.now()
-        if new_date_parsed < now:
+        window_end = now + timedelta(days=settings.APPOINTMENT_BOOKING_WINDOW_DAYS)
+        if mode == 'nearest':
+            new_date_parsed = max(new_date_parsed, now)
+        elif new_date_parsed < now:
             return Response({"detail": "New appointment date must be in the future."}, status=status.HTTP_400_BAD_REQUEST)
-        if new_date_parsed > now + timedelta(days=15):
-            return Response({"detail": "New appointment date must be within 15 days."}, status=status.HTTP_400_BAD_REQUEST)
-        appointment.appointment_date = new_date_parsed
-        appointment.status = 'RESCHEDULED'
-        appointment.save()
-        from .tasks import notify_reschedule
-        notify_reschedule.delay(appointment.id)
-        return Response({"detail": "Appointment rescheduled by doctor."}, status=status.HTTP_200_OK)
+        if new_date_parsed > window_end:
+            return Response({"detail": f"New appointment date must be within {settings.APPOINTMENT_BOOKING_WINDOW_DAYS} days."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if mode == 'exact' and not availability.on_grid(new_date_parsed):
+            return Response({"detail": SLOT_GRID_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+        version = expected_version(request)
+        try:
+            with transaction.atomic():
+                if mode == 'nearest':
+                    reschedule_to_nearest(appointment, new_date_parsed, window_end, version)
+                else:
+                    reschedule_appointment(appointment, new_date_parsed, version)
+                outbox.enqueue('appointments.tasks.notify_reschedule', appointment.id,
+                               dedupe_key=f'appointment:{appointment.id}:reschedule')
+        except (BookingError, ConflictError, TransitionError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({"detail": success_detail, "appointment_date": appointment.appointment_date,
+                         "version": appointment.version}, status=status.HTTP_200_OK)
+
+
+class DoctorAvailabilityView(generics.GenericAPIView):
+    """
+    Open slots for a doctor within the booking window, read from the availability index.
+    Query params: doctor (required), from / to (optional ISO dates).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        doctor_id = request.query_params.get('doctor')
+        if not doctor_id or not doctor_id.isdigit():
+            return Response({"detail": "A numeric doctor id is required."}, status=status.HTTP_400_BAD_REQUEST)
+        today = timezone.localdate()
+        last_day = today + timedelta(days=settings.APPOINTMENT_BOOKING_WINDOW_DAYS)
+        date_from = max(parse_day(request.query_params, 'from', today), today)
+        date_to = min(parse_day(request.query_params, 'to', last_day), last_day)
+        days = availability.open_slots(int(doctor_id), date_from, date_to) if date_from <= date_to else []
+        return Response({
+            "doctor": int(doctor_id),
+            "slot_minutes": settings.APPOINTMENT_SLOT_MINUTES,
+            "days": days,
+        }, status=status.HTTP_200_OK)
+
+
+class WaitlistOfferAcceptView(generics.GenericAPIView):
+    """
+    Accept a slot offered from the waitlist, confirming the held appointment.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return WaitlistOffer.objects.filter(appointment__patient=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        offer = self.get_object()
+        try:
+            accept_offer(offer)
+        except OfferError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({"detail": "Offer accepted. Your appointment is confirmed.",
+                         "appointment_id": offer.appointment_id}, status=status.HTTP_200_OK)
 
 
 class WaitlistEntryCreateView(generics.CreateAPIView):
@@ -126,4 +335,134 @@ class WaitlistEntryCreateView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     
     def perform_create(self, serializer):
-        serializer.save(patient=self.request.user)
\ No newline at end of file
+        serializer.save(patient=self.request.user)
+
+
+class CalendarFeedTokenView(generics.GenericAPIView):
+    """
+    GET returns the user's iCalendar subscription URL, creating it on first use.
+    POST issues a new token, so the previous URL stops working.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        feed, _ = CalendarFeed.objects.get_or_create(user=request.user)
+        return Response(self.feed_data(request, feed), status=status.HTTP_200_OK)
+
+    def post(self, request, *args, **kwargs):
+        with transaction.atomic():
+            CalendarFeed.objects.filter(user=request.user).delete()
+            feed = CalendarFeed.objects.create(user=request.user)
+        return Response(self.feed_data(request, feed), status=status.HTTP_201_CREATED)
+
+    def feed_data(self, request, feed):
+        url = request.build_absolute_uri(reverse('calendar-feed', kwargs={'token': feed.token}))
+        return {"url": url, "created_at": feed.created_at}
+
+
+class CalendarFeedView(View):
+    """
+    Tokenized .ics feed of the user's appointments for calendar subscriptions.
+    Unchanged feeds are answered with a 304 from a single aggregate query.
+    """
+
+    def get(self, request, token):
+        feed = get_object_or_404(CalendarFeed.objects.select_related('user'), token=token)
+        queryset = ics.feed_queryset(feed.user)
+        etag = ics.feed_etag(feed.user, queryset)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = StreamingHttpResponse(
+                ics.iter_calendar(feed.user, queryset), content_type='text/calendar; charset=utf-8'
+            )
+            response['Content-Disposition'] = 'inline; filename="appointments.ics"'
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class AppointmentExportView(generics.GenericAPIView):
+    """
+    Staff-only export of appointments, archived ones included, joined with their
+    payments and streamed as the cursor is read. GET export/appointments.<csv|jsonl>[.gz]; optional
+    date_from / date_to (ISO dates or datetimes) bound appointment_date.
+    For very large ranges prefer `manage.py export_appointments`.
+    """
+    permission_classes = [IsAdminUser]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is never rendered by DRF; don't 406 on Accept: text/csv.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, fmt, *args, **kwargs):
+        base, _, suffix = fmt.partition('.')
+        if base not in export.FORMATS or suffix not in ('', 'gz'):
+            return Response({"detail": "Use appointments.csv, .jsonl, .csv.gz or .jsonl.gz."},
+                            status=status.HTTP_404_NOT_FOUND)
+        params = request.query_params
+        date_from = parse_bound(params['date_from'], 'date_from') if params.get('date_from') else None
+        date_to = parse_bound(params['date_to'], 'date_to', end=True) if params.get('date_to') else None
+        compress = suffix == 'gz'
+        content_type = 'text/csv' if base == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(
+            export.stream_export(export.export_rows(date_from, date_to), base, compress),
+            content_type='application/gzip' if compress else f'{content_type}; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="appointments.{fmt}"'
+        return response
+
+
+class AppointmentImportView(generics.GenericAPIView):
+    """
+    Staff-only bulk import. Send a multipart `file` (CSV with a header row, or .jsonl)
+    or a JSON list of rows; columns are doctor, patient (user ids), appointment_date
+    and optional status (PENDING or CONFIRMED). Valid rows are inserted and the rest
+    reported per row; ?dry_run=1 validates without saving.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        upload = request.FILES.get('file')
+        if upload is not None:
+            fmt = 'jsonl' if upload.name.endswith('.jsonl') else 'csv'
+            result = import_file(upload.read(), fmt, dry_run=dry_run)
+        elif isinstance(request.data, list):
+            result = AppointmentImporter(dry_run=dry_run).run(request.data)
+        else:
+            return Response({"detail": "Upload a file or send a JSON list of rows."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({"dry_run": dry_run, **result}, status=status.HTTP_200_OK)
+
+
+class DoctorStatsView(generics.GenericAPIView):
+    """
+    Staff-only utilization dashboard read from the DoctorDayStats rollup.
+    Query params: date_from / date_to (ISO dates, default the last 30 days), doctor (optional id).
+    """
+    permission_classes = [IsAdminUser]
+    max_days = 366
+
+    def get(self, request, *args, **kwargs):
+        today = timezone.localdate()
+        params = request.query_params
+        date_to = parse_day(params, 'date_to', today)
+        date_from = parse_day(params, 'date_from', date_to - timedelta(days=29))
+        if date_to < date_from or (date_to - date_from).days >= self.max_days:
+            return Response({"detail": f"date_to must be on or after date_from and span at most {self.max_days} days."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rows = DoctorDayStats.objects.filter(date__range=(date_from, date_to))
+        doctor = params.get('doctor')
+        if doctor:
+            if not doctor.isdigit():
+                return Response({"detail": "doctor must be a numeric id."}, status=status.HTTP_400_BAD_REQUEST)
+            rows = rows.filter(doctor_id=int(doctor))
+        data = []
+        for row in rows.order_by('date', 'doctor_id').values(
+            'doctor_id', 'date', 'booked', 'pending', 'confirmed', 'rescheduled', 'canceled', 'revenue', 'refreshed_at'
+        ):
+            total = row['booked'] + row['canceled']
+            row['cancel_rate'] = round(row['canceled'] / total, 3) if total else 0.0
+            data.append(row)
+        return Response(data, status=status.HTTP_200_OK)
+
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from notifications import outbox
+from .models import Waitlist, WaitlistOffer
+from .availability import slot_key
+from .services import (
+    BookingError, ConflictError, TransitionError, book_appointment, cancel_appointment, confirm_appointment,
+)
+
+
+class OfferError(Exception):
+    pass
+
+
+def enqueue_freed_slot(doctor_id, appointment_date):
+    """
+    Queue the hand-off of a freed slot to the waitlist: a held offer to the oldest
+    entry, or an email to everyone waiting when holds are disabled. Call inside the
+    transaction that frees the slot.
+    """
+    if settings.WAITLIST_OFFER_HOLD_MINUTES:
+        task = 'appointments.tasks.offer_freed_slot'
+    else:
+        task = 'appointments.tasks.notify_availability'
+    outbox.enqueue(task, doctor_id, appointment_date.isoformat())
+
+
+def offer_slot(doctor_id, appointment_date):
+    """
+    Offer a freed slot to the oldest waitlist entry for that doctor and day.
+
+    The entry is popped from the head of the (doctor, desired_date, created_at)
+    index, so a cancellation costs one indexed read instead of a scan and an email
+    per waitlisted patient. The slot is held for the patient by a PENDING
+    appointment; if the hold expires, the next entry in line gets the offer.
+    Returns the offer, or None when nobody is waiting or the slot was taken.
+    """
+    if appointment_date <= timezone.now():
+        return None
+    day = slot_key(appointment_date)[0]
+    with transaction.atomic():
+        entry = (
+            Waitlist.objects.select_for_update(skip_locked=True)
+            .filter(doctor_id=doctor_id, desired_date=day)
+            .order_by('created_at')
+            .first()
+        )
+        if entry is None:
+            return None
+        try:
+            hold = book_appointment(
+                doctor_id=doctor_id,
+                patient_id=entry.patient_id,
+                appointment_date=appointment_date,
+                status='PENDING',
+            )
+        except BookingError:
+            # Someone booked the slot directly; the entry keeps its place in the queue.
+            return None
+        entry.delete()
+        offer = WaitlistOffer.objects.create(
+            appointment=hold,
+            expires_at=timezone.now() + timedelta(minutes=settings.WAITLIST_OFFER_HOLD_MINUTES),
+        )
+        outbox.enqueue('appointments.tasks.send_waitlist_offer', offer.id)
+        # The outbox holds the expiry until it is due, so no long-lived ETA task sits in the broker.
+        outbox.enqueue('appointments.tasks.expire_waitlist_offer', offer.id, available_at=offer.expires_at)
+    return offer
+
+
+def accept_offer(offer):
+    with transaction.atomic():
+        # Lock the offer only; confirm_appointment takes the day lock before touching the hold.
+        offer = WaitlistOffer.objects.select_for_update(of=('self',)).select_related('appointment').get(pk=offer.pk)
+        if offer.status != 'OFFERED' or offer.expires_at <= timezone.now():
+            raise OfferError("This offer is no longer available.")
+        try:
+            confirm_appointment(offer.appointment)
+        except (BookingError, ConflictError, TransitionError) as exc:
+            raise OfferError(str(exc))
+        offer.status = 'ACCEPTED'
+        offer.save(update_fields=['status'])
+    return offer
+
+
+def expire_offer(offer_id):
+    """Release an unaccepted hold and pass the slot on to the next entry in line."""
+    with transaction.atomic():
+        offer = (
+            WaitlistOffer.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('appointment')
+            .filter(pk=offer_id, status='OFFERED', expires_at__lte=timezone.now())
+            .first()
+        )
+        if offer is None:
+            return None
+        offer.status = 'EXPIRED'
+        offer.save(update_fields=['status'])
+        hold = offer.appointment
+        if hold.status != 'CANCELED':
+            cancel_appointment(hold)
+    return offer_slot(hold.doctor_id, hold.appointment_date)
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'accounts.apps.AccountsConfig',
     'appointments.apps.AppointmentsConfig',
     'payments.apps.PaymentsConfig',
+    'notifications.apps.NotificationsConfig',
     ]
 
 MIDDLEWARE = [
@@ -159,6 +160,45 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Appointment scheduling
+# The daily grid is split into fixed slots; 08:00-18:00 at 20 minutes gives the 30 slots per doctor per day.
+APPOINTMENT_BOOKING_WINDOW_DAYS = 15
+APPOINTMENT_SLOT_MINUTES = 20
+APPOINTMENT_DAY_START = '08:00'
+APPOINTMENT_DAY_END = '18:00'
+# Seconds a worker trusts its cached DoctorProfile.max_appointments before re-reading it.
+DOCTOR_CAPACITY_CACHE_TTL = 60
+
+# Cache: Redis is already required for Celery, so it also backs the shared response cache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://localhost:6379/2'),
+    }
+}
+# Cached appointment list/detail responses: shared-cache TTL in seconds and in-process LRU size.
+APPOINTMENT_CACHE_TTL = 300
+APPOINTMENT_CACHE_LOCAL_SIZE = 1024
+# Minutes a freed slot is held for the oldest waitlisted patient before it moves down the queue.
+# Set to 0 to email every waitlisted patient instead.
+WAITLIST_OFFER_HOLD_MINUTES = 30
+# iCalendar feeds: days of past appointments kept in the feed and rows fetched per cursor round trip.
+CALENDAR_FEED_PAST_DAYS = 90
+CALENDAR_FEED_CHUNK_SIZE = 500
+# Staff exports: rows per server-side cursor fetch and per streamed chunk.
+EXPORT_CHUNK_SIZE = 2000
+# Bulk imports: rows validated and inserted per transaction.
+IMPORT_BATCH_SIZE = 1000
+# Archival: appointments this many days in the past move to the archive table, in batches.
+APPOINTMENT_ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 1000
+# Idempotency-Key on booking and payment POSTs: seconds a stored response is replayed,
+# seconds a request holds its in-flight lock, and how long a concurrent duplicate waits for it
+# before answering 409 (keep this well below the worker timeout).
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+IDEMPOTENCY_LOCK_SECONDS = 60
+IDEMPOTENCY_WAIT_SECONDS = 2
+
 # Celery configuration
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/1')
@@ -166,6 +206,42 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'drain-notification-outbox': {
+        'task': 'notifications.tasks.drain_outbox',
+        'schedule': 5.0,
+    },
+    'expire-stale-pending-appointments': {
+        'task': 'appointments.tasks.expire_stale_appointments',
+        'schedule': 60.0,
+    },
+    'expire-stale-payments': {
+        'task': 'payments.tasks.expire_stale_payments',
+        'schedule': 300.0,
+    },
+    'refresh-doctor-day-stats': {
+        'task': 'appointments.tasks.refresh_doctor_stats',
+        'schedule': 300.0,
+    },
+}
+# Outbox drainer: rows claimed per transaction and maximum batches per run.
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_MAX_BATCHES = 20
+# Window in which repeated notifications for the same appointment and event are merged into one.
+NOTIFICATION_DEBOUNCE_SECONDS = 30
+# Stale-hold sweepers: unpaid PENDING holds and payments never approved on PayPal
+# are released after these many minutes, SWEEP_BATCH_SIZE rows per transaction.
+PENDING_APPOINTMENT_TTL_MINUTES = 30
+PENDING_PAYMENT_TTL_MINUTES = 180
+SWEEP_BATCH_SIZE = 500
+SWEEP_MAX_BATCHES = 20
+# Utilization rollup: doctor-days recomputed per query, and how far behind now each refresh
+# stops so rows from transactions still in flight are not skipped.
+ROLLUP_BATCH_SIZE = 500
+ROLLUP_LAG_SECONDS = 60
+
+# Number of appointments loaded and mailed per batch by bulk notification tasks.
+NOTIFICATION_BATCH_SIZE = 200
 
 
 # Email Configuration for Notifications
@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import OutboxMessage
 
-# Register your models here.
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'args', 'available_at', 'attempts', 'created_at')
+    search_fields = ('task',)
+    ordering = ('available_at', 'id')
+    readonly_fields = ('created_at',)
+
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
@@ -0,0 +1,23 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from notifications.outbox import drain_all
+
+
+class Command(BaseCommand):
+    help = "Dispatch pending notification outbox rows to Celery, once or continuously with --loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep draining until interrupted.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when idle in --loop mode.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = drain_all(options['batch_size'])
+            if sent:
+                self.stdout.write(f"Dispatched {sent} outbox messages.")
+            if not options['loop']:
+                break
+            if not sent:
+                time.sleep(options['interval'])
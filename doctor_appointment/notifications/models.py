@@ -1,3 +1,26 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class OutboxMessage(models.Model):
+    """
+    A Celery task to dispatch, written in the same transaction as the change that
+    caused it. The drainer sends pending rows to the broker and deletes them, so a
+    rolled-back transaction never emits a task and a broker outage never blocks a request.
+    """
+    task = models.CharField(max_length=255)  # Registered Celery task name
+    args = models.JSONField(default=list)
+    available_at = models.DateTimeField(default=timezone.now)  # Not dispatched before this time
+    # Pending messages sharing a key are coalesced into one, e.g. "appointment:42:reschedule".
+    dedupe_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='outbox_available_idx'),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.id} - {self.task}{tuple(self.args)}"
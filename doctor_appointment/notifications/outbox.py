@@ -0,0 +1,75 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from doctor_appointment.celery import app
+from .models import OutboxMessage
+
+
+def enqueue(task, *args, available_at=None, dedupe_key=None):
+    """
+    Record a task for dispatch. Call inside the transaction that makes the change;
+    the row commits or rolls back with it.
+
+    With a dedupe_key the message waits NOTIFICATION_DEBOUNCE_SECONDS, and any
+    further message with the same key enqueued before it is dispatched replaces
+    its arguments instead of adding another row. Bursts collapse into one task
+    that runs at the end of the first window.
+    """
+    if dedupe_key is None:
+        return OutboxMessage.objects.create(task=task, args=list(args), available_at=available_at or timezone.now())
+    available_at = available_at or timezone.now() + timedelta(seconds=settings.NOTIFICATION_DEBOUNCE_SECONDS)
+    with transaction.atomic():
+        pending = OutboxMessage.objects.select_for_update().filter(dedupe_key=dedupe_key).first()
+        if pending is None:
+            try:
+                with transaction.atomic():
+                    return OutboxMessage.objects.create(
+                        task=task, args=list(args), available_at=available_at, dedupe_key=dedupe_key
+                    )
+            except IntegrityError:
+                # A concurrent transaction created it first; coalesce into that row.
+                pending = OutboxMessage.objects.select_for_update().get(dedupe_key=dedupe_key)
+        pending.task = task
+        pending.args = list(args)
+        pending.save(update_fields=['task', 'args'])
+    return pending
+
+
+def drain(batch_size=None):
+    """
+    Claim up to batch_size due rows with SKIP LOCKED, send them to the broker and
+    delete them. Concurrent drainers take disjoint batches. Returns the number sent.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        rows = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(available_at__lte=timezone.now())
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        sent = []
+        for row in rows:
+            try:
+                app.send_task(row.task, args=row.args)
+            except Exception as exc:
+                # Broker trouble: keep the row for the next run and stop this batch.
+                row.attempts += 1
+                row.last_error = str(exc)
+                row.save(update_fields=['attempts', 'last_error'])
+                break
+            sent.append(row.id)
+        OutboxMessage.objects.filter(id__in=sent).delete()
+    return len(sent)
+
+
+def drain_all(batch_size=None, max_batches=None):
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    max_batches = max_batches or settings.OUTBOX_MAX_BATCHES
+    total = 0
+    for _ in range(max_batches):
+        sent = drain(batch_size)
+        total += sent
+        if sent < batch_size:
+            break
+    return total
@@ -0,0 +1,6 @@
+from celery import shared_task
+from .outbox import drain_all
+
+@shared_task
+def drain_outbox():
+    return drain_all()
@@ -1,3 +1,86 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from . import outbox
+from .models import OutboxMessage
 
-# Create your tests here.
+
+@mock.patch('notifications.outbox.app.send_task')
+class OutboxTests(TestCase):
+    def test_message_commits_with_its_transaction(self, send_task):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            outbox.enqueue('appointments.tasks.notify_reschedule', 1)
+            raise RuntimeError
+        self.assertFalse(OutboxMessage.objects.exists())
+        outbox.enqueue('appointments.tasks.notify_reschedule', 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_drain_sends_due_rows_in_order_and_deletes_them(self, send_task):
+        outbox.enqueue('appointments.tasks.send_waitlist_offer', 1)
+        outbox.enqueue('appointments.tasks.expire_waitlist_offer', 1, available_at=timezone.now() + timedelta(minutes=5))
+        outbox.enqueue('appointments.tasks.notify_reschedule', 2)
+        self.assertEqual(outbox.drain(), 2)
+        self.assertEqual(send_task.call_args_list, [
+            mock.call('appointments.tasks.send_waitlist_offer', args=[1]),
+            mock.call('appointments.tasks.notify_reschedule', args=[2]),
+        ])
+        self.assertEqual(list(OutboxMessage.objects.values_list('task', flat=True)),
+                         ['appointments.tasks.expire_waitlist_offer'])
+
+    def test_broker_failure_keeps_the_row(self, send_task):
+        send_task.side_effect = ConnectionError('broker down')
+        outbox.enqueue('appointments.tasks.notify_reschedule', 1)
+        outbox.enqueue('appointments.tasks.notify_reschedule', 2)
+        self.assertEqual(outbox.drain(), 0)
+        self.assertEqual(send_task.call_count, 1)
+        first = OutboxMessage.objects.order_by('id').first()
+        self.assertEqual((first.attempts, first.last_error), (1, 'broker down'))
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+        send_task.side_effect = None
+        self.assertEqual(outbox.drain(), 2)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_drain_all_works_through_batches(self, send_task):
+        for appointment_id in range(5):
+            outbox.enqueue('appointments.tasks.notify_reschedule', appointment_id)
+        self.assertEqual(outbox.drain_all(batch_size=2), 5)
+        self.assertEqual(send_task.call_count, 5)
+
+    def test_drain_all_stops_after_max_batches(self, send_task):
+        for appointment_id in range(5):
+            outbox.enqueue('appointments.tasks.notify_reschedule', appointment_id)
+        self.assertEqual(outbox.drain_all(batch_size=2, max_batches=2), 4)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+
+@mock.patch('notifications.outbox.app.send_task')
+class DedupeTests(TestCase):
+    def test_burst_collapses_into_one_message(self, send_task):
+        start = timezone.now()
+        first = outbox.enqueue('appointments.tasks.notify_reschedule', 1, dedupe_key='appointment:1:reschedule')
+        outbox.enqueue('appointments.tasks.notify_reschedule', 1, 'latest', dedupe_key='appointment:1:reschedule')
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.pk, first.pk)
+        self.assertEqual(message.args, [1, 'latest'])
+        # Later messages do not push the dispatch time back.
+        self.assertEqual(message.available_at, first.available_at)
+        self.assertGreaterEqual(message.available_at, start + timedelta(seconds=settings.NOTIFICATION_DEBOUNCE_SECONDS))
+        self.assertEqual(outbox.drain(), 0)
+
+    def test_keys_are_independent(self, send_task):
+        outbox.enqueue('appointments.tasks.notify_reschedule', 1, dedupe_key='appointment:1:reschedule')
+        outbox.enqueue('appointments.tasks.notify_reschedule', 2, dedupe_key='appointment:2:reschedule')
+        outbox.enqueue('appointments.tasks.notify_doctor_cancellation', 1, dedupe_key='appointment:1:doctor_cancel')
+        self.assertEqual(OutboxMessage.objects.count(), 3)
+
+    @override_settings(NOTIFICATION_DEBOUNCE_SECONDS=0)
+    def test_key_is_free_again_once_dispatched(self, send_task):
+        outbox.enqueue('appointments.tasks.notify_reschedule', 1, dedupe_key='appointment:1:reschedule')
+        self.assertEqual(outbox.drain(), 1)
+        outbox.enqueue('appointments.tasks.notify_reschedule', 1, dedupe_key='appointment:1:reschedule')
+        self.assertEqual(outbox.drain(), 1)
+        self.assertEqual(send_task.call_count, 2)
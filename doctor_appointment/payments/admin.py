@@ -2,7 +2,9 @@ from django.contrib import admin
 from .models import Payment
 
 class PaymentAdmin(admin.ModelAdmin):
-    list_display = ('id', 'appointment', 'amount', 'currency', 'status', 'transaction_id', 'created_at')
+    # appointment_id, not appointment: the changelist would INNER JOIN appointments and hide
+    # the payments of archived or deleted ones.
+    list_display = ('id', 'appointment_id', 'amount', 'currency', 'status', 'transaction_id', 'created_at')
     list_filter = ('status', 'currency', 'created_at')
     search_fields = ('appointment__doctor__name', 'appointment__patient__name', 'transaction_id')
     ordering = ('-created_at',)
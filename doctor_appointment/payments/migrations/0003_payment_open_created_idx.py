@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0010_appt_pending_created_idx'),
+        ('payments', '0002_payment_appointment_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status__in', ['CREATED', 'PENDING'])), fields=['status', 'created_at'], name='payment_open_created_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils.functional import cached_property
 
 class Payment(models.Model):
     STATUS_CHOICES = [
@@ -8,9 +9,15 @@ class Payment(models.Model):
         ('COMPLETED', 'Completed'),
         ('FAILED', 'Failed'),
     ]
+    # No database constraint: archived appointments leave the appointments table but
+    # keep their id, and their payments stay here as the financial record. That is
+    # also what happens on a real delete (admin, or a user deleted with their
+    # appointments): the payment is what PayPal charged, so it is kept, and its
+    # appointment_record is None from then on.
     appointment = models.ForeignKey(
         'appointments.Appointment', 
-        on_delete=models.CASCADE, 
+        on_delete=models.DO_NOTHING, 
+        db_constraint=False,
         related_name='payments'
     )
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -19,6 +26,25 @@ class Payment(models.Model):
     transaction_id = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Stale-payment sweeper: payments still awaiting PayPal approval, oldest first.
+            models.Index(
+                fields=['status', 'created_at'],
+                condition=models.Q(status__in=['CREATED', 'PENDING']),
+                name='payment_open_created_idx',
+            ),
+        ]
     
+    @cached_property
+    def appointment_record(self):
+        """The paid appointment, read from the archive once it has left the hot table; None if it is gone."""
+        from appointments.models import Appointment, ArchivedAppointment
+        try:
+            return self.appointment
+        except Appointment.DoesNotExist:
+            return ArchivedAppointment.objects.select_related('doctor', 'patient').filter(pk=self.appointment_id).first()
+
     def __str__(self):
-        return f"Payment {self.id} for Appointment {self.appointment.id}"
+        return f"Payment {self.id} for Appointment {self.appointment_id}"
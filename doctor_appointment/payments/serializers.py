@@ -9,9 +9,10 @@ class PaymentSerializer(serializers.ModelSerializer):
         source='appointment',
         write_only=True
     )
-    appointment_date = serializers.DateTimeField(source='appointment.appointment_date', read_only=True)
-    doctor = serializers.CharField(source='appointment.doctor.name', read_only=True)
-    patient = serializers.CharField(source='appointment.patient.name', read_only=True)
+    # Through appointment_record so payments of archived appointments still serialize.
+    appointment_date = serializers.DateTimeField(source='appointment_record.appointment_date', read_only=True)
+    doctor = serializers.CharField(source='appointment_record.doctor.name', read_only=True)
+    patient = serializers.CharField(source='appointment_record.patient.name', read_only=True)
 
     class Meta:
         model = Payment
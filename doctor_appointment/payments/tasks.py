@@ -1,4 +1,7 @@
+from datetime import timedelta
 from celery import shared_task
+from django.db import transaction
+from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
 from .models import Payment
@@ -7,12 +10,39 @@ from .models import Payment
 def send_payment_confirmation(payment_id):
     try:
         payment = Payment.objects.get(id=payment_id)
-        send_mail(
-            'Payment Confirmation',
-            f'Your payment for appointment {payment.appointment.id} has been completed successfully.',
-            settings.DEFAULT_FROM_EMAIL,
-            [payment.appointment.patient.email],
-            fail_silently=False,
-        )
     except Payment.DoesNotExist:
-        pass
+        return
+    appointment = payment.appointment_record
+    if appointment is None:
+        return
+    send_mail(
+        'Payment Confirmation',
+        f'Your payment for appointment {payment.appointment_id} has been completed successfully.',
+        settings.DEFAULT_FROM_EMAIL,
+        [appointment.patient.email],
+        fail_silently=False,
+    )
+
+@shared_task
+def expire_stale_payments():
+    """
+    Beat sweeper: mark payments left in CREATED/PENDING for longer than
+    PENDING_PAYMENT_TTL_MINUTES as FAILED, SWEEP_BATCH_SIZE rows per transaction.
+    Rows come oldest first off the open-payment index and locked ones are skipped.
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.PENDING_PAYMENT_TTL_MINUTES)
+    total = 0
+    for _ in range(settings.SWEEP_MAX_BATCHES):
+        with transaction.atomic():
+            ids = list(
+                Payment.objects.select_for_update(skip_locked=True)
+                .filter(status__in=('CREATED', 'PENDING'), created_at__lt=cutoff)
+                .order_by('created_at')
+                .values_list('id', flat=True)[:settings.SWEEP_BATCH_SIZE]
+            )
+            Payment.objects.filter(id__in=ids).update(status='FAILED', updated_at=timezone.now())
+        total += len(ids)
+        if len(ids) < settings.SWEEP_BATCH_SIZE:
+            break
+    return total
+
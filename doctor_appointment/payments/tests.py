@@ -1,3 +1,89 @@
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import CustomUser
+from appointments.archive import archive_batch
+from appointments.models import Appointment
+from .models import Payment
+from .serializers import PaymentSerializer
+from .tasks import send_payment_confirmation
 
-# Create your tests here.
+
+class ArchivedAppointmentPaymentTests(TestCase):
+    def setUp(self):
+        doctor = CustomUser.objects.create_user('doc', 'doc@example.com', 'pw')
+        CustomUser.objects.filter(pk=doctor.pk).update(role='doctor')
+        patient = CustomUser.objects.create_user('pat', 'pat@example.com', 'pw', role='patient')
+        self.appointment = Appointment.objects.create(
+            doctor=doctor, patient=patient, status='CONFIRMED',
+            appointment_date=timezone.now() - timedelta(days=200),
+        )
+        self.payment = Payment.objects.create(appointment=self.appointment, amount='50.00', status='COMPLETED')
+
+    def test_payment_outlives_archived_appointment(self):
+        archive_batch(timezone.now() - timedelta(days=90))
+        self.assertFalse(Appointment.objects.filter(pk=self.appointment.pk).exists())
+
+        payment = Payment.objects.get(pk=self.payment.pk)
+        self.assertEqual(payment.appointment_record.pk, self.appointment.pk)
+        data = PaymentSerializer(payment).data
+        self.assertEqual(data['appointment_date'][:10], self.appointment.appointment_date.date().isoformat())
+
+        send_payment_confirmation(payment.pk)
+        self.assertEqual(mail.outbox[0].to, ['pat@example.com'])
+
+    def test_missing_appointment_is_tolerated(self):
+        Appointment.objects.filter(pk=self.appointment.pk).delete()
+        payment = Payment.objects.get(pk=self.payment.pk)
+        self.assertIsNone(payment.appointment_record)
+        self.assertIsNone(PaymentSerializer(payment).data.get('appointment_date'))
+        send_payment_confirmation(payment.pk)
+        self.assertEqual(mail.outbox, [])
+
+    def test_admin_lists_payments_without_a_live_appointment(self):
+        other = Appointment.objects.create(
+            doctor=self.appointment.doctor, patient=self.appointment.patient,
+            appointment_date=timezone.now() - timedelta(days=300),
+        )
+        Payment.objects.create(appointment=other, amount='20.00')
+        archive_batch(timezone.now() - timedelta(days=250))
+        Appointment.objects.filter(pk=self.appointment.pk).delete()
+        self.assertEqual(Payment.objects.count(), 2)
+        admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/payments/payment/')
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+
+class CreatePaymentIdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        doctor = CustomUser.objects.create_user('doc', 'doc@example.com', 'pw')
+        CustomUser.objects.filter(pk=doctor.pk).update(role='doctor')
+        self.patient = CustomUser.objects.create_user('pat', 'pat@example.com', 'pw', role='patient')
+        self.appointment = Appointment.objects.create(
+            doctor=doctor, patient=self.patient, appointment_date=timezone.now() + timedelta(days=5),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    @mock.patch('payments.views.paypalrestsdk.Payment')
+    def test_retry_does_not_create_a_second_paypal_payment(self, paypal_payment):
+        paypal = paypal_payment.return_value
+        paypal.create.return_value = True
+        paypal.id = 'PAY-1'
+        paypal.links = [mock.Mock(method='REDIRECT', rel='approval_url', href='https://paypal.test/approve')]
+        data = {'appointment_id': self.appointment.id, 'amount': '50.00'}
+
+        first = self.client.post('/api/payments/create/', data, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        retry = self.client.post('/api/payments/create/', data, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.data, {'approval_url': 'https://paypal.test/approve'})
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(paypal.create.call_count, 1)
+        self.assertEqual(Payment.objects.count(), 1)
@@ -3,6 +3,7 @@ from django.conf import settings
 from rest_framework import status, views
 from rest_framework.response import Response
 from .models import Payment
+from appointments.idempotency import idempotent
 from appointments.models import Appointment
 from .serializers import PaymentSerializer
 
@@ -17,7 +18,9 @@ class CreatePaymentView(views.APIView):
     """
     Create a PayPal payment for a given appointment.
     Expected payload: { "appointment_id": int, "amount": "decimal", "currency": "USD" }
+    Send an Idempotency-Key header so a retry does not create a second PayPal payment.
     """
+    @idempotent
     def post(self, request, *args, **kwargs):
         appointment_id = request.data.get("appointment_id")
         amount = request.data.get("amount")